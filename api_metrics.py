@@ -0,0 +1,158 @@
+"""
+Prometheus metrics for the API, served at /metrics.
+
+Request latency, response size and in-flight requests are measured by a WSGI middleware around
+the app, so streamed responses (the export) are timed and sized until their last chunk is sent.
+Database query counts and time are summed per request from SQLAlchemy cursor events on every
+engine, including the replica.
+
+Under gunicorn, set PROMETHEUS_MULTIPROC_DIR to an empty directory writable by the workers:
+every worker then writes its samples there and /metrics aggregates all of them, whichever
+worker serves it. gunicorn.conf.py clears the directory on start and marks exited workers dead.
+"""
+
+import os
+import time
+
+from flask import Response, has_request_context, request
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest
+from prometheus_client import multiprocess
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import app
+
+STATS_KEY = "api_metrics.stats"
+ROUTE_KEY = "api_metrics.route"
+
+REQUEST_SECONDS = Histogram(
+    "api_request_duration_seconds", "Request latency, until the last byte of the body is sent",
+    ["route", "method", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+RESPONSE_BYTES = Histogram(
+    "api_response_bytes", "Response body size as sent, after compression",
+    ["route"],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864),
+)
+IN_PROGRESS = Gauge(
+    "api_requests_in_progress", "Requests being served", multiprocess_mode="livesum",
+)
+DB_QUERIES = Histogram(
+    "api_db_queries_per_request", "Database queries executed per request",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 10, 25, 50, 100),
+)
+DB_SECONDS = Histogram(
+    "api_db_seconds_per_request", "Time spent executing database queries per request",
+    ["route"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 10, 30),
+)
+# Hit ratio: rate(api_cache_requests_total{result="hit"}) / rate(api_cache_requests_total)
+CACHE_REQUESTS = Counter(
+    "api_cache_requests_total", "Lookups of the per-worker caches and client-cached responses",
+    ["cache", "result"],
+)
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+class RequestStats:
+    def __init__(self):
+        self.status = ""
+        self.queries = 0
+        self.query_seconds = 0.0
+
+
+def current_stats():
+    return request.environ.get(STATS_KEY) if has_request_context() else None
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Queries on one connection never overlap, so a single start time per connection is enough
+    conn.info["api_metrics.query_start"] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info.pop("api_metrics.query_start", None)
+    stats = current_stats()
+    if stats is not None and start is not None:
+        stats.queries += 1
+        stats.query_seconds += time.perf_counter() - start
+
+
+@app.before_request
+def record_route():
+    # The URL rule rather than the path, so /responses/<entity> is one label whatever the entity
+    request.environ[ROUTE_KEY] = request.url_rule.rule if request.url_rule else "unmatched"
+
+
+class ObservedBody:
+    """Wraps a WSGI response body to count the bytes sent and record the request when it closes."""
+
+    def __init__(self, body, on_close):
+        self.body = body
+        self.on_close = on_close
+        self.bytes = 0
+
+    def __iter__(self):
+        for chunk in self.body:
+            self.bytes += len(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            if hasattr(self.body, "close"):
+                self.body.close()
+        finally:
+            self.on_close(self.bytes)
+
+
+class MetricsMiddleware:
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        if environ.get("PATH_INFO") == "/metrics":
+            return self.wsgi_app(environ, start_response)
+
+        stats = environ[STATS_KEY] = RequestStats()
+        start = time.perf_counter()
+
+        def observed_start_response(status, headers, exc_info=None):
+            stats.status = status.split(" ", 1)[0]
+            return start_response(status, headers, exc_info)
+
+        def finish(body_bytes):
+            IN_PROGRESS.dec()
+            route = environ.get(ROUTE_KEY, "unmatched")
+            REQUEST_SECONDS.labels(route, environ.get("REQUEST_METHOD", ""), stats.status).observe(time.perf_counter() - start)
+            RESPONSE_BYTES.labels(route).observe(body_bytes)
+            DB_QUERIES.labels(route).observe(stats.queries)
+            DB_SECONDS.labels(route).observe(stats.query_seconds)
+
+        IN_PROGRESS.inc()
+        try:
+            body = self.wsgi_app(environ, observed_start_response)
+        except Exception:
+            stats.status = "500"
+            finish(0)
+            raise
+        return ObservedBody(body, finish)
+
+
+app.wsgi_app = MetricsMiddleware(app.wsgi_app)
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
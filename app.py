@@ -5,13 +5,16 @@ import warnings
 
 from flask import Flask, request, jsonify
 from flask_compress import Compress
-from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import NullPool
 
-# Logging setup (following team pattern)
+# Logging setup (following team pattern). LOG_LEVEL=DEBUG logs every library's debug output,
+# which is costly under load.
 logging.basicConfig(
     stream=sys.stdout,
-    level=logging.DEBUG,
+    level=os.getenv('LOG_LEVEL', 'INFO').upper(),
     format='%(thread)d: %(message)s'
 )
 logger = logging.getLogger("metrics-api")
@@ -22,9 +25,41 @@ app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL').replace('postg
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 app.config['SQLALCHEMY_ECHO'] = (os.getenv('SQLALCHEMY_ECHO', False) == 'True')
 
+# Optional read replica for the API, see replica.py. Only sessions switched to it use it.
+# Connections to it time out after REPLICA_CONNECT_TIMEOUT seconds, unless the URL sets
+# connect_timeout, so an unreachable replica can't hold a request for the OS TCP timeout.
+REPLICA_CONNECT_TIMEOUT = int(os.getenv('REPLICA_CONNECT_TIMEOUT', 2))
+if os.getenv('DATABASE_REPLICA_URL'):
+    replica_url = make_url(os.getenv('DATABASE_REPLICA_URL').replace('postgres://', 'postgresql://'))
+    if 'connect_timeout' not in replica_url.query:
+        replica_url = replica_url.update_query_dict({'connect_timeout': str(REPLICA_CONNECT_TIMEOUT)})
+    app.config['SQLALCHEMY_BINDS'] = {'replica': replica_url.render_as_string(hide_password=False)}
+
+# Connections are opened per session by default. Threaded/evented workers serving many concurrent
+# requests can set SQLALCHEMY_POOL_SIZE to keep a per-worker pool of connections instead.
+SQLALCHEMY_POOL_SIZE = int(os.getenv('SQLALCHEMY_POOL_SIZE', 0))
+
+class RoutingSession(SignallingSession):
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        # session.info["bind"] is the session-level switch set by replica.use_replica()
+        bind = self.info.get("bind")
+        if bind is not None:
+            return bind
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+
 class NullPoolSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return sessionmaker(class_=RoutingSession, db=self, **options)
+
+
     def apply_driver_hacks(self, flask_app, info, options):
-        options['poolclass'] = NullPool
+        if SQLALCHEMY_POOL_SIZE:
+            options['pool_size'] = SQLALCHEMY_POOL_SIZE
+            options['max_overflow'] = SQLALCHEMY_POOL_SIZE
+            options['pool_pre_ping'] = True
+        else:
+            options['poolclass'] = NullPool
         return super(NullPoolSQLAlchemy, self).apply_driver_hacks(flask_app, info, options)
 
 db = NullPoolSQLAlchemy(app, session_options={"autoflush": False})
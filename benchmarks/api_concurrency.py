@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Measure how requests/s scales with concurrency for each API endpoint.
+
+Start the API against a local Postgres in the serving mode under test, for example:
+
+    GUNICORN_WORKER_CLASS=sync    gunicorn views:app -b 127.0.0.1:5106 -w 4
+    GUNICORN_WORKER_CLASS=gthread gunicorn views:app -b 127.0.0.1:5106 -w 4
+    GUNICORN_WORKER_CLASS=gevent  gunicorn views:app -b 127.0.0.1:5106 -w 4
+
+then run this script once per mode and compare the tables (or the --json files):
+
+    python benchmarks/api_concurrency.py --url http://127.0.0.1:5106 --label gthread --json gthread.json
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import aiohttp
+
+ENDPOINTS = {
+    "schema": "/schema",
+    "coverage": "/coverage",
+    "match-rates": "/match-rates",
+    "responses": "/responses/works?page=1&per_page=100",
+    "responses-filtered": "/responses/works?page=1&per_page=100&filterTest=primary_source_lost",
+    "responses-projected": "/responses/works?page=1&per_page=100&fields=match",
+}
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+async def run_level(session, url, concurrency, duration):
+    """Hit url from `concurrency` concurrent clients for `duration` seconds."""
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def client():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                async with session.get(url) as response:
+                    await response.read()
+                    if response.status != 200:
+                        errors += 1
+                        continue
+            except aiohttp.ClientError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+    }
+
+
+async def run_benchmark(base_url, endpoints, levels, duration):
+    results = {}
+    connector = aiohttp.TCPConnector(limit=max(levels))
+    async with aiohttp.ClientSession(connector=connector, headers={"Accept-Encoding": "gzip"}) as session:
+        for name in endpoints:
+            url = base_url.rstrip("/") + ENDPOINTS[name]
+            results[name] = []
+            for concurrency in levels:
+                level = await run_level(session, url, concurrency, duration)
+                results[name].append(level)
+                print(f"{name:<20} c={concurrency:<4} {level['rps']:>8.1f} req/s  "
+                      f"p50 {level['p50_ms']:>7.1f} ms  p95 {level['p95_ms']:>7.1f} ms  "
+                      f"({level['requests']} ok, {level['errors']} errors)", flush=True)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark API throughput at increasing concurrency")
+    parser.add_argument('--url', default="http://127.0.0.1:5106", help="Base URL of the running API")
+    parser.add_argument('--label', default="", help="Label for this run, e.g. the worker class")
+    parser.add_argument('--endpoints', default=",".join(ENDPOINTS), help="Comma-separated endpoint names")
+    parser.add_argument('--levels', default="1,2,4,8,16,32", help="Comma-separated concurrency levels")
+    parser.add_argument('--duration', type=float, default=10, help="Seconds to run each level")
+    parser.add_argument('--json', help="Also write the results to this JSON file")
+
+    args = parser.parse_args()
+    endpoints = args.endpoints.split(",")
+    levels = [int(level) for level in args.levels.split(",")]
+
+    results = asyncio.run(run_benchmark(args.url, endpoints, levels, args.duration))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"label": args.label, "url": args.url, "duration": args.duration, "results": results}, f, indent=2)
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Load test the API with a realistic mix of requests and report throughput and latency per endpoint.
+
+Where benchmarks/api_concurrency.py repeats one fixed URL per endpoint, this drives every endpoint
+at once the way the dashboard does: /schema, /coverage and /match-rates, and /responses paged with
+varying page and per_page, with and without filterTest on one or two test keys. Each client picks
+its requests from its own seeded random generator, so a run is repeatable with --seed.
+
+Build the database with benchmarks/load_fixture.py, start the API on it, then:
+
+    python benchmarks/api_load.py --url http://127.0.0.1:5106 --mix dashboard --concurrency 16 --duration 60
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schema import get_test_keys
+
+from api_concurrency import percentile
+
+# Relative weights of the endpoints in each mix
+MIXES = {
+    # Opening the dashboard and browsing the responses behind its numbers
+    "dashboard": {"schema": 1, "coverage": 2, "match-rates": 2, "responses": 3, "responses-filtered": 4},
+    "responses": {"responses": 1, "responses-filtered": 1},
+    "summary": {"schema": 1, "coverage": 1, "match-rates": 1},
+}
+PER_PAGE_WEIGHTS = {10: 1, 25: 2, 50: 2, 100: 5}
+
+
+def pick(rng, weights):
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+
+def responses_page(rng, sample_size, per_page):
+    """Mostly the first pages, as when browsing from the top, and sometimes a page anywhere in the sample."""
+    last_page = max(1, -(-sample_size // per_page))
+    roll = rng.random()
+    if roll < 0.7:
+        return 1
+    if roll < 0.9:
+        return min(rng.randint(2, 5), last_page)
+    return rng.randint(1, last_page)
+
+
+def build_request(rng, endpoint, entity, test_keys, sample_size):
+    """The path of one request to endpoint."""
+    if endpoint in ("schema", "coverage", "match-rates"):
+        return f"/{endpoint}"
+    per_page = pick(rng, PER_PAGE_WEIGHTS)
+    if endpoint == "responses":
+        return f"/responses/{entity}?page={responses_page(rng, sample_size, per_page)}&per_page={per_page}"
+    filter_test = ",".join(rng.sample(test_keys, 2 if rng.random() < 0.15 else 1))
+    page = 1 if rng.random() < 0.8 else rng.randint(2, 3)
+    return f"/responses/{entity}?page={page}&per_page={per_page}&filterTest={filter_test}"
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.bytes = 0
+
+
+async def sample_size(session, base_url, entity):
+    async with session.get(f"{base_url}/responses/{entity}?per_page=1") as response:
+        data = await response.json()
+    return data["meta"]["sample_size"]
+
+
+async def run_load(base_url, mix, entity, concurrency, duration, warmup, seed):
+    stats = defaultdict(EndpointStats)
+    test_keys = get_test_keys(entity)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, headers={"Accept-Encoding": "gzip"}) as session:
+        size = await sample_size(session, base_url, entity)
+        print(f"{entity} sample of {size} IDs, {concurrency} clients, mix {mix}: {MIXES[mix]}", flush=True)
+        started = time.perf_counter()
+        measure_from = started + warmup
+        deadline = measure_from + duration
+
+        async def client(index):
+            rng = random.Random(f"{seed}-{index}")
+            while time.perf_counter() < deadline:
+                endpoint = pick(rng, MIXES[mix])
+                url = base_url + build_request(rng, endpoint, entity, test_keys, size)
+                start = time.perf_counter()
+                try:
+                    async with session.get(url) as response:
+                        body = await response.read()
+                        ok = response.status == 200
+                except aiohttp.ClientError:
+                    body, ok = b"", False
+                if start < measure_from:
+                    continue
+                endpoint_stats = stats[endpoint]
+                if ok:
+                    endpoint_stats.latencies.append(time.perf_counter() - start)
+                    endpoint_stats.bytes += len(body)
+                else:
+                    endpoint_stats.errors += 1
+
+        await asyncio.gather(*[client(i) for i in range(concurrency)])
+        elapsed = time.perf_counter() - measure_from
+
+    results = {}
+    for endpoint in list(MIXES[mix]) + ["all"]:
+        if endpoint == "all":
+            latencies = [latency for s in stats.values() for latency in s.latencies]
+            errors = sum(s.errors for s in stats.values())
+            bytes_ = sum(s.bytes for s in stats.values())
+        else:
+            latencies, errors, bytes_ = stats[endpoint].latencies, stats[endpoint].errors, stats[endpoint].bytes
+        results[endpoint] = {
+            "requests": len(latencies),
+            "errors": errors,
+            "rps": len(latencies) / elapsed,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "max_ms": max(latencies, default=0) * 1000,
+            "mean_kb": bytes_ / len(latencies) / 1024 if latencies else 0,
+        }
+    return results
+
+
+def print_results(results):
+    print(f"\n{'endpoint':<20} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'mean KB':>8}")
+    for endpoint, r in results.items():
+        print(f"{endpoint:<20} {r['requests']:>9} {r['errors']:>7} {r['rps']:>8.1f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} "
+              f"{r['p99_ms']:>8.1f} {r['max_ms']:>8.1f} {r['mean_kb']:>8.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load test the API with a mix of realistic requests")
+    parser.add_argument('--url', default="http://127.0.0.1:5106", help="Base URL of the running API")
+    parser.add_argument('--mix', default="dashboard", choices=list(MIXES), help="Request mix")
+    parser.add_argument('--entity', default="works", help="Entity whose responses are requested")
+    parser.add_argument('--concurrency', type=int, default=8, help="Concurrent clients")
+    parser.add_argument('--duration', type=float, default=30, help="Seconds to measure")
+    parser.add_argument('--warmup', type=float, default=5, help="Seconds to run before measuring")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed for the request sequence")
+    parser.add_argument('--json', help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    base_url = args.url.rstrip("/")
+    results = asyncio.run(run_load(base_url, args.mix, args.entity, args.concurrency, args.duration, args.warmup, args.seed))
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"url": base_url, "mix": args.mix, "entity": args.entity, "concurrency": args.concurrency,
+                       "duration": args.duration, "seed": args.seed, "results": results}, f, indent=2)
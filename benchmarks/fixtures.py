@@ -0,0 +1,164 @@
+"""
+Deterministic prod/walden document pairs shaped like OpenAlex API results, for offline benchmarks.
+
+Works carry every field the works tests in schema.py read: nested authorships with institutions
+and countries, locations, topics, concepts, an abstract index and so on. Other entities carry the
+counts their tests compare. The walden side of each pair is a copy of prod with a share of fields
+changed, dropped or added, so the tests see the mix of matches and differences they see in a run.
+"""
+
+import copy
+import random
+
+OPENALEX = "https://openalex.org/"
+OA_STATUSES = ["gold", "green", "hybrid", "bronze", "closed", "diamond"]
+LICENSES = ["cc-by", "cc-by-nc", "cc-by-sa", "other-oa", None]
+LANGUAGES = ["en", "en", "en", "en", "es", "fr", "de", "pt", "zh", "ja"]
+WORK_TYPES = ["article", "article", "article", "book-chapter", "dataset", "preprint", "review"]
+COUNTRIES = ["US", "GB", "DE", "FR", "CN", "JP", "BR", "IN", "CA", "AU", "ES", "IT", "NL", "KR"]
+WORDS = ["protein", "binding", "cell", "model", "analysis", "network", "climate", "effect", "study",
+         "patients", "data", "method", "learning", "growth", "signal", "response", "energy", "risk"]
+
+
+def openalex_id(prefix, rng, high=5_000_000_000):
+    return f"{OPENALEX}{prefix}{rng.randrange(1, high)}"
+
+
+def make_abstract(rng, n_words):
+    index = {}
+    for position in range(n_words):
+        index.setdefault(rng.choice(WORDS), []).append(position)
+    return index
+
+
+def make_authorship(rng):
+    institutions = [
+        {"id": openalex_id("I", rng, 5_000_000), "display_name": "Institution", "country_code": rng.choice(COUNTRIES), "type": "education"}
+        for _ in range(rng.choice([0, 1, 1, 1, 2, 3]))
+    ]
+    return {
+        "author_position": "middle",
+        "author": {"id": openalex_id("A", rng), "display_name": "Author Name", "orcid": None},
+        "institutions": institutions,
+        "countries": sorted({institution["country_code"] for institution in institutions}),
+        "is_corresponding": rng.random() < 0.1,
+        "raw_author_name": "Author Name",
+        "raw_affiliation_strings": ["Department, Institution, City"] * len(institutions),
+    }
+
+
+def make_location(rng):
+    return {
+        "is_oa": rng.random() < 0.5,
+        "landing_page_url": f"https://doi.org/10.{rng.randrange(1000, 9999)}/{rng.randrange(10 ** 6)}",
+        "pdf_url": f"https://example.org/{rng.randrange(10 ** 6)}.pdf" if rng.random() < 0.4 else None,
+        "source": {"id": openalex_id("S", rng, 300_000_000), "display_name": "Journal", "type": "journal"} if rng.random() < 0.9 else None,
+        "license": rng.choice(LICENSES),
+        "version": "publishedVersion",
+    }
+
+
+def make_work(i, rng):
+    authorships = [make_authorship(rng) for _ in range(min(int(rng.expovariate(1 / 5)) + 1, 60))]
+    locations = [make_location(rng) for _ in range(rng.choice([1, 1, 2, 3, 4]))]
+    topics = [{"id": openalex_id("T", rng, 14_000), "display_name": "Topic", "score": rng.random()} for _ in range(rng.choice([0, 1, 3]))]
+    year = rng.randrange(1950, 2026)
+    return {
+        "id": f"{OPENALEX}W{1_000_000 + i}",
+        "doi": f"https://doi.org/10.{rng.randrange(1000, 9999)}/{i}",
+        "title": " ".join(rng.choice(WORDS) for _ in range(rng.randrange(4, 16))).capitalize(),
+        "display_name": None,
+        "publication_year": year,
+        "publication_date": f"{year}-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}",
+        "ids": {
+            "openalex": f"{OPENALEX}W{1_000_000 + i}",
+            "doi": f"https://doi.org/10.{rng.randrange(1000, 9999)}/{i}",
+            "mag": str(rng.randrange(10 ** 9, 10 ** 10)) if rng.random() < 0.6 else None,
+            "pmid": f"https://pubmed.ncbi.nlm.nih.gov/{rng.randrange(10 ** 7, 10 ** 8)}" if rng.random() < 0.3 else None,
+        },
+        "language": rng.choice(LANGUAGES),
+        "primary_location": locations[0],
+        "type": rng.choice(WORK_TYPES),
+        "indexed_in": sorted(rng.sample(["crossref", "pubmed", "doaj", "arxiv"], rng.randrange(1, 3))),
+        "open_access": {"is_oa": locations[0]["is_oa"], "oa_status": rng.choice(OA_STATUSES), "oa_url": locations[0]["pdf_url"]},
+        "authorships": authorships,
+        "corresponding_author_ids": [a["author"]["id"] for a in authorships if a["is_corresponding"]],
+        "apc_list": {"value": 2000, "currency": "USD", "value_usd": 2000} if rng.random() < 0.3 else None,
+        "apc_paid": {"value": 1800, "currency": "USD", "value_usd": 1800} if rng.random() < 0.2 else None,
+        "fwci": round(rng.lognormvariate(0, 1), 3) if rng.random() < 0.8 else None,
+        "is_retracted": rng.random() < 0.002,
+        "cited_by_count": int(rng.lognormvariate(2, 1.5)),
+        "primary_topic": topics[0] if topics else None,
+        "topics": topics,
+        "keywords": [{"id": f"{OPENALEX}keywords/{rng.choice(WORDS)}", "score": rng.random()} for _ in range(rng.randrange(0, 6))],
+        "concepts": [{"id": openalex_id("C", rng, 3_000_000_000), "level": rng.randrange(0, 4), "score": rng.random()} for _ in range(rng.randrange(0, 12))],
+        "mesh": [{"descriptor_ui": f"D{rng.randrange(10 ** 5, 10 ** 6)}", "is_major_topic": False} for _ in range(rng.choice([0, 0, 3, 8]))],
+        "locations_count": len(locations),
+        "locations": locations,
+        "best_oa_location": next((location for location in locations if location["is_oa"]), None),
+        "sustainable_development_goals": [{"id": f"https://metadata.un.org/sdg/{rng.randrange(1, 18)}", "score": rng.random()} for _ in range(rng.choice([0, 0, 1, 2]))],
+        "grants": [{"funder": openalex_id("F", rng, 5_000_000), "award_id": str(rng.randrange(10 ** 6))} for _ in range(rng.choice([0, 0, 0, 1, 2]))],
+        "awards": None,
+        "referenced_works_count": rng.randrange(0, 80),
+        "referenced_works": [openalex_id("W", rng) for _ in range(rng.randrange(0, 40))],
+        "related_works": [openalex_id("W", rng) for _ in range(10)],
+        "abstract_inverted_index": make_abstract(rng, rng.randrange(80, 300)) if rng.random() < 0.7 else None,
+        "updated_date": "2025-07-21T00:00:00",
+    }
+
+
+def make_entity_doc(entity, i, rng):
+    """A non-works document with the counts and fields their tests read."""
+    return {
+        "id": f"{OPENALEX}{entity}/{i}" if entity not in ("authors", "institutions", "sources", "publishers", "funders", "topics", "concepts") else f"{OPENALEX}{entity[0].upper()}{1000 + i}",
+        "display_name": f"{entity} {i}",
+        "works_count": int(rng.lognormvariate(4, 2)),
+        "cited_by_count": int(rng.lognormvariate(6, 2)),
+        "type": rng.choice(["journal", "repository", "conference", "funder", "education", "company"]),
+        "is_oa": rng.random() < 0.3,
+        "host_organization": openalex_id("P", rng, 5_000_000) if rng.random() < 0.7 else None,
+        "counts_by_year": [{"year": 2025 - k, "works_count": rng.randrange(100), "cited_by_count": rng.randrange(1000)} for k in range(10)],
+        "updated_date": "2025-07-21T00:00:00",
+    }
+
+
+def make_doc(entity, i, rng):
+    return make_work(i, rng) if entity == "works" else make_entity_doc(entity, i, rng)
+
+
+def diverge(doc, rng, rate=0.1):
+    """A walden copy of a prod document with roughly rate of its top-level fields changed."""
+    walden = copy.deepcopy(doc)
+    for key in list(walden):
+        if key in ("id", "ids") or rng.random() >= rate:
+            continue
+        value = walden[key]
+        if isinstance(value, bool):
+            walden[key] = not value
+        elif isinstance(value, int):
+            walden[key] = max(0, value + rng.randrange(-5, 10))
+        elif isinstance(value, float):
+            walden[key] = round(value * rng.uniform(0.5, 1.5), 3)
+        elif isinstance(value, list) and value:
+            walden[key] = value[:rng.randrange(len(value))] if rng.random() < 0.5 else value + value[:1]
+        elif isinstance(value, str):
+            walden[key] = value[::-1] if rng.random() < 0.5 else None
+        elif value is None:
+            continue
+        else:
+            walden[key] = None
+    return walden
+
+
+def make_pairs(entity, n, seed=0, divergence=0.1, missing=0.02):
+    """
+    n (prod, walden) document pairs for entity. A missing share of walden documents is None,
+    as for IDs the walden API doesn't return.
+    """
+    rng = random.Random(f"{entity}-{seed}")
+    pairs = []
+    for i in range(n):
+        prod = make_doc(entity, i, rng)
+        walden = None if rng.random() < missing else diverge(prod, rng, divergence)
+        pairs.append((prod, walden))
+    return pairs
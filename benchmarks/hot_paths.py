@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the comparison hot paths in metrics.py and schema.py, runnable offline.
+
+Covers calc_match per entity, get_field_value, get_nested_strings on wildcard paths, every test
+function used in schema.py, calc_match_rates and calc_spearman_rho, over the fixture documents
+in benchmarks/fixtures.py.
+
+Each timing is stored relative to a fixed pure-Python calibration loop timed alongside it, so a
+baseline recorded on one machine stays comparable on another, or on the same one at a different
+clock speed. Compare against the stored
+baseline (exits 1 when any case is more than --threshold slower):
+
+    python benchmarks/hot_paths.py
+
+Cases that regress are re-measured --retries times and only fail when every attempt regresses.
+Record a new baseline after an intended change:
+
+    python benchmarks/hot_paths.py --save-baseline
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# metrics imports app, which needs a database URL to configure itself but never connects here
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/unused")
+
+import metrics
+from metrics import calc_match, calc_match_rates, calc_spearman_rho, get_field_value, get_nested_strings
+from schema import entities, tests_schema
+
+from fixtures import make_pairs
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hot_paths_baseline.json")
+DEFAULT_THRESHOLD = 0.25
+WORKS_PAIRS = 500
+ENTITY_PAIRS = 200
+NESTED_PATHS = ["authorships[*].institutions[*].id", "authorships[*].author.id", "authorships[*].countries", "topics[*].id"]
+
+
+def calibration():
+    total = 0
+    for i in range(200_000):
+        total += i % 7
+    return total
+
+
+def timed_calls(fn, number):
+    start = time.perf_counter()
+    for _ in range(number):
+        fn()
+    return time.perf_counter() - start
+
+
+def autorange(fn, min_seconds):
+    number = 1
+    while timed_calls(fn, number) < min_seconds:
+        number *= 2
+    return number
+
+
+def measure(fn, repeat, min_seconds=0.05):
+    """
+    Time fn against the calibration loop, returning (seconds per call, relative to calibration).
+    Each repeat times fn and then the calibration back to back, each called enough times to take
+    at least min_seconds, and the best of each is kept; garbage collection is paused as in timeit.
+    Pairing the two keeps the ratio stable when CPU speed drifts during a run on a shared machine.
+    """
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        number = autorange(fn, min_seconds)
+        calibration_number = autorange(calibration, min_seconds)
+        best = best_relative = float("inf")
+        for _ in range(repeat):
+            seconds = timed_calls(fn, number) / number
+            unit = timed_calls(calibration, calibration_number) / calibration_number
+            best = min(best, seconds)
+            best_relative = min(best_relative, seconds / unit)
+        return best, best_relative
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def build_cases():
+    """Return {name: fn} where each fn runs one batch over the fixtures."""
+    cases = {}
+    pairs = {entity: make_pairs(entity, WORKS_PAIRS if entity == "works" else ENTITY_PAIRS) for entity in entities}
+    works_docs = [doc for pair in pairs["works"] for doc in pair if doc is not None]
+
+    for entity in entities:
+        def run_calc_match(entity=entity):
+            for prod, walden in pairs[entity]:
+                calc_match(prod, walden, entity)
+        cases[f"calc_match/{entity}"] = run_calc_match
+
+    for field in ["primary_location.source.id", "open_access.oa_status", "cited_by_count", "apc_paid.value_usd"]:
+        def run_get_field_value(field=field):
+            for doc in works_docs:
+                get_field_value(doc, field)
+        cases[f"get_field_value/{field}"] = run_get_field_value
+
+    for path in NESTED_PATHS:
+        def run_get_nested_strings(path=path):
+            for doc in works_docs:
+                get_nested_strings(doc, path)
+        cases[f"get_nested_strings/{path}"] = run_get_nested_strings
+
+    # Every test function, fed the values of the fields it is actually used on
+    test_inputs = {}
+    for entity in entities:
+        for test in tests_schema[entity]:
+            values = [(get_field_value(prod, test["field"]), get_field_value(walden, test["field"])) for prod, walden in pairs[entity]]
+            test_inputs.setdefault(test["test_func"], []).extend(values)
+    for test_func, values in sorted(test_inputs.items(), key=lambda item: item[0].__name__):
+        def run_test_func(test_func=test_func, values=values):
+            for prod_value, walden_value in values:
+                test_func(prod_value, walden_value)
+        cases[f"schema/{test_func.__name__}"] = run_test_func
+
+    # calc_match_rates reads the module-level samples and matches of a run
+    metrics.samples.clear()
+    metrics.matches.clear()
+    for entity in entities:
+        ids = [prod["id"] for prod, _ in pairs[entity]]
+        metrics.samples[entity]["both"] = {"ids": ids}
+        metrics.matches[entity] = {id: calc_match(prod, walden, entity) for id, (prod, walden) in zip(ids, pairs[entity])}
+    cases["calc_match_rates"] = calc_match_rates
+
+    rng = random.Random(0)
+    rho_pairs = []
+    for _ in range(10_000):
+        x = int(rng.lognormvariate(2, 1.5))
+        rho_pairs.append((x, x + rng.randrange(-3, 4)))
+    cases["calc_spearman_rho/10000"] = lambda: calc_spearman_rho(rho_pairs)
+
+    return cases
+
+
+def run(include, repeat=7):
+    results = {}
+    for name, fn in build_cases().items():
+        if not include(name):
+            continue
+        seconds, relative = measure(fn, repeat)
+        results[name] = {"seconds": seconds, "relative": relative}
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print every case against the baseline and return the names that regressed beyond threshold."""
+    regressions = []
+    print(f"\n{'case':<56} {'time':>10} {'baseline':>10} {'change':>8}")
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<56} {result['seconds'] * 1000:>8.3f}ms {'-':>10} {'new':>8}")
+            continue
+        change = result["relative"] / base["relative"] - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<56} {result['seconds'] * 1000:>8.3f}ms {base['seconds'] * 1000:>8.3f}ms {change:>+7.1%}{flag}")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the comparison hot paths against a stored baseline")
+    parser.add_argument('--save-baseline', action='store_true', help="Store these results as the new baseline instead of comparing")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="Baseline JSON file")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help="Fail when a case is slower than baseline by more than this fraction")
+    parser.add_argument('--filter', action='append', help="Only run cases whose name contains this; may be repeated")
+    parser.add_argument('--repeat', type=int, default=7, help="Timed repeats per case; the best is kept")
+    parser.add_argument('--retries', type=int, default=2, help="Re-measure regressed cases this many times before failing")
+    args = parser.parse_args()
+
+    results = run(lambda name: not args.filter or any(pattern in name for pattern in args.filter), args.repeat)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)["cases"]
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump({"cases": baseline}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Saved {len(results)} cases to {args.baseline}")
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        sys.exit(f"No baseline at {args.baseline}; record one with --save-baseline")
+    with open(args.baseline) as f:
+        baseline = json.load(f)["cases"]
+    regressions = compare(results, baseline, args.threshold)
+    for _ in range(args.retries):
+        if not regressions:
+            break
+        # A slow stretch on a shared machine can fail a case once; a real regression fails every time
+        print(f"\nRe-measuring {len(regressions)} case(s)")
+        regressions = compare(run(regressions.__contains__, args.repeat), baseline, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} case(s) more than {args.threshold:.0%} slower than the baseline")
+        sys.exit(1)
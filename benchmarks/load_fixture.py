@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Build a local Postgres database for load testing the API with benchmarks/api_load.py.
+
+Every sample in samples.json is loaded as is. Each --entity then gets a "both" sample of --size
+IDs, the one /responses pages through: the entity's IDs from samples.json, cut to size or padded
+with synthetic IDs. Its prod/walden documents are generated as in benchmarks/synthetic_corpus.py
+and stored by an offline metrics run, with responses, coverage and match rates saved just as
+after a real run.
+
+    python benchmarks/load_fixture.py --database-url postgresql://postgres@localhost/metrics_load --create --size 10000
+    DATABASE_URL=postgresql://postgres@localhost/metrics_load gunicorn views:app -b 127.0.0.1:5106 -w 4
+    python benchmarks/api_load.py --url http://127.0.0.1:5106
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+
+from synthetic_corpus import generate, synthetic_id
+
+SAMPLES_FILE = os.path.join(ROOT, "samples.json")
+SAMPLE_NAME = "LoadTest"
+
+
+def create_database(database_url):
+    """Create the database named in database_url if it doesn't exist yet."""
+    url = make_url(database_url.replace("postgres://", "postgresql://"))
+    engine = create_engine(url.set(database="postgres"), isolation_level="AUTOCOMMIT")
+    with engine.connect() as connection:
+        exists = connection.execute(text("SELECT 1 FROM pg_database WHERE datname = :name"), {"name": url.database}).scalar()
+        if not exists:
+            connection.execute(text(f'CREATE DATABASE "{url.database}"'))
+            print(f"Created database {url.database}")
+    engine.dispose()
+
+
+def sample_ids(samples_file, entity, size):
+    """size IDs for entity: those of its samples in samples_file, "both" samples first, then synthetic ones."""
+    with open(samples_file) as f:
+        samples = json.load(f)
+    ordered = sorted((sample for sample in samples.values() if sample.get("entity") == entity), key=lambda sample: sample.get("type") != "both")
+    ids = list(dict.fromkeys(id for sample in ordered for id in sample["ids"]))[:size]
+    ids += [synthetic_id(entity, i) for i in range(size - len(ids))]
+    return ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a local database for API load tests")
+    parser.add_argument('--database-url', default=os.getenv("DATABASE_URL"), help="Database to fill (default DATABASE_URL)")
+    parser.add_argument('--create', action='store_true', help="Create the database first if it doesn't exist")
+    parser.add_argument('--entity', action='append', help="Entity to build a 'both' sample and responses for; may be repeated (default works)")
+    parser.add_argument('--size', type=int, default=10000, help="IDs in each 'both' sample")
+    parser.add_argument('--rate', type=float, default=0.05, help="Share of pairs in which each test field differs")
+    parser.add_argument('--missing', type=float, default=0.02, help="Share of IDs with no walden document")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed")
+    parser.add_argument('--samples', default=SAMPLES_FILE, help="samples.json to load")
+    args = parser.parse_args()
+
+    if not args.database_url:
+        sys.exit("Set DATABASE_URL or pass --database-url")
+    if args.create:
+        create_database(args.database_url)
+
+    # app reads DATABASE_URL when first imported
+    os.environ["DATABASE_URL"] = args.database_url
+    from load_samples import load_samples_bulk
+    from make_sample import save_sample
+    from metrics import run_metrics
+    from migrate import migrate
+
+    migrate()
+    load_samples_bulk(args.samples)
+
+    with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False) as corpus:
+        for entity in args.entity or ["works"]:
+            ids = sample_ids(args.samples, entity, args.size)
+            # Saved after samples.json, so it is the latest "both" sample of the entity
+            save_sample(f"{SAMPLE_NAME}-{entity}", entity, "both", "all", ids)
+            for record in generate(entity, len(ids), None, args.rate, {}, args.missing, args.seed, ids=ids):
+                corpus.write(json.dumps(record, separators=(",", ":")))
+                corpus.write("\n")
+    try:
+        asyncio.run(run_metrics(loader="copy", corpus=corpus.name, save_corpus=True))
+    finally:
+        os.remove(corpus.name)
+
+
+if __name__ == '__main__':
+    main()
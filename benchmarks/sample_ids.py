@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Compare sample IDs stored as a JSON list with the compact id_prefix / id_nums pair.
+
+Encodable samples only store the compact pair, so for each of them the JSON list is written to a
+temporary table to compare against. Reports the stored sizes of both, the time to load the IDs
+both ways, and the time of a whole-sample responses join binding the IDs as a text[] vs as the
+one comma-separated string used for compact samples.
+
+    python benchmarks/sample_ids.py --repeat 20
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from sqlalchemy import text
+
+from app import app, db
+from models import Sample, ids_from_columns
+from queries import sample_ids_sql
+from sample_cache import CachedSample
+
+
+def best_time(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def count_responses(sample):
+    sample_from, params = sample_ids_sql(sample)
+    return db.session.execute(text(f"SELECT count(*) FROM {sample_from} JOIN responses r ON r.id = s.id"), params).scalar()
+
+
+def run(repeat, min_ids):
+    with app.app_context():
+        samples = db.session.execute(text("""
+            SELECT name, cardinality(id_nums) AS n, pg_column_size(id_nums) + pg_column_size(id_prefix) AS compact_bytes
+            FROM samples
+            WHERE id_nums IS NOT NULL AND cardinality(id_nums) >= :min_ids
+            ORDER BY n DESC
+        """), {'min_ids': min_ids}).all()
+
+        db.session.execute(text("CREATE TEMPORARY TABLE sample_ids_json (name text PRIMARY KEY, ids json)"))
+
+        print(f"{'sample':<24} {'ids':>7} {'json bytes':>11} {'compact':>9} {'json load':>10} {'compact load':>13} {'array join':>11} {'string join':>12}")
+        for sample in samples:
+            def load_compact():
+                return db.session.query(*Sample.ids_columns()).filter_by(name=sample.name).one()
+
+            ids = ids_from_columns(*load_compact())
+            db.session.execute(text("INSERT INTO sample_ids_json VALUES (:name, :ids)"), {'name': sample.name, 'ids': json.dumps(ids)})
+            json_bytes = db.session.execute(text("SELECT pg_column_size(ids) FROM sample_ids_json WHERE name = :name"), {'name': sample.name}).scalar()
+
+            def load_json():
+                return db.session.execute(text("SELECT ids FROM sample_ids_json WHERE name = :name"), {'name': sample.name}).scalar()
+
+            assert load_json() == ids
+            array_sample = CachedSample(sample.name, None, ids)
+            string_sample = CachedSample(sample.name, None, ids, load_compact().id_list)
+            assert count_responses(array_sample) == count_responses(string_sample)
+
+            timings = [
+                best_time(load_json, repeat),
+                best_time(lambda: ids_from_columns(*load_compact()), repeat),
+                best_time(lambda: count_responses(array_sample), repeat),
+                best_time(lambda: count_responses(string_sample), repeat),
+            ]
+            print(f"{sample.name:<24} {sample.n:>7} {json_bytes:>11} {sample.compact_bytes:>9} "
+                  + " ".join(f"{timing * 1000:>{width}.2f}ms" for timing, width in zip(timings, (8, 11, 9, 10))))
+
+        db.session.rollback()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare JSON and compact storage of sample IDs")
+    parser.add_argument('--repeat', type=int, default=20, help="Timed runs per measurement; the best is reported")
+    parser.add_argument('--min-ids', type=int, default=100, help="Skip samples with fewer IDs than this")
+    args = parser.parse_args()
+
+    run(args.repeat, args.min_ids)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Compare the chunked INSERT and the COPY + merge response loaders used by save_data.
+
+Each size is loaded three times into a scratch copy of the responses table: into an empty
+table (all inserts), again unchanged (all conflicts, skipped by digest) and again with every
+row rewritten.
+
+    python benchmarks/save_data_bulk.py --sizes 10000,100000
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from sqlalchemy import MetaData, text
+
+from app import app, db
+from bulk_load import response_digest, upsert_responses_copy, upsert_responses_insert
+from metrics import calc_match
+from models import Response
+
+BENCH_TABLE = "responses_bench"
+
+
+def make_rows(n):
+    """Synthetic works rows of roughly production shape, with a match computed by calc_match."""
+    now = datetime.now()
+    rows = []
+    for i in range(n):
+        prod = {
+            "id": f"https://openalex.org/W{i}",
+            "title": f"Synthetic work {i}",
+            "type": "article",
+            "language": "en",
+            "cited_by_count": i % 500,
+            "primary_location": {"source": {"id": f"https://openalex.org/S{i % 1000}"}},
+            "authorships": [
+                {"author": {"id": f"https://openalex.org/A{i * 3 + k}"}, "institutions": [{"id": f"https://openalex.org/I{(i + k) % 2000}"}]}
+                for k in range(3)
+            ],
+            "abstract_inverted_index": {f"word{k}": [k] for k in range(60)},
+        }
+        walden = dict(prod, cited_by_count=prod["cited_by_count"] + i % 3)
+        match = calc_match(prod, walden, "works")
+        rows.append({
+            'id': f"W{i}",
+            'entity': "works",
+            'date': now,
+            'prod': prod,
+            'walden': walden,
+            'match': match,
+            'digest': response_digest(prod, walden, match),
+        })
+    return rows
+
+
+def reset_table():
+    db.session.execute(text(f"DROP TABLE IF EXISTS {BENCH_TABLE}"))
+    db.session.execute(text(f"CREATE TABLE {BENCH_TABLE} (LIKE responses INCLUDING ALL)"))
+    db.session.commit()
+
+
+def time_loader(load, rows):
+    """Time a load into an empty table, an unchanged reload (skipped by digest) and a forced rewrite."""
+    reset_table()
+    timings = []
+    for skip_unchanged in (True, True, False):
+        start = time.perf_counter()
+        load(rows, skip_unchanged)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def run(sizes):
+    bench_table = Response.__table__.to_metadata(MetaData(), name=BENCH_TABLE)
+    results = []
+    with app.app_context():
+        for size in sizes:
+            rows = make_rows(size)
+            loaders = {
+                "insert": lambda rows, skip: upsert_responses_insert(db.session, rows, table=bench_table, skip_unchanged=skip),
+                "copy": lambda rows, skip: upsert_responses_copy(rows, table_name=BENCH_TABLE, skip_unchanged=skip),
+            }
+            for name, load in loaders.items():
+                results.append((size, name, *time_loader(load, rows)))
+        db.session.execute(text(f"DROP TABLE IF EXISTS {BENCH_TABLE}"))
+        db.session.commit()
+
+    print(f"\n{'rows':>8}  {'loader':<10} {'empty table':>12} {'unchanged':>10} {'rewrite all':>12}")
+    for size, name, insert_time, unchanged_time, rewrite_time in results:
+        print(f"{size:>8}  {name:<10} {insert_time:>11.2f}s {unchanged_time:>9.2f}s {rewrite_time:>11.2f}s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time the response loaders used by save_data")
+    parser.add_argument('--sizes', default="10000,100000", help="Comma-separated row counts")
+    args = parser.parse_args()
+
+    run([int(size) for size in args.sizes.split(",")])
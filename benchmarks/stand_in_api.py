@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Serve a corpus written by benchmarks/synthetic_corpus.py the way the OpenAlex API serves the
+requests run_metrics makes, so a full run, fetching included, can be measured at any scale.
+
+Only byte offsets are kept in memory; documents are read from the (uncompressed) corpus file per
+request. Answers `GET /<entity>?filter=<field>:<id>|<id>...` with the prod documents, or the
+walden ones with `data-version=2`, and `GET /<entity>` with the entity's count.
+
+    python benchmarks/stand_in_api.py corpus.jsonl --port 8099
+    OPENALEX_API_URL=http://localhost:8099/ python run_metrics.py --scope synthetic --test
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict
+
+from aiohttp import web
+
+
+def index_corpus(path):
+    """Map entity -> id -> byte offset of its line in the corpus."""
+    offsets = defaultdict(dict)
+    with open(path, "rb") as f:
+        offset = 0
+        for line in f:
+            # synthetic_corpus.py writes entity and id first, so the start of the line is enough
+            head = line[:200].decode("utf-8", "replace")
+            if head.startswith('{"entity":"') and '","id":"' in head:
+                entity, _, rest = head[len('{"entity":"'):].partition('","id":"')
+                id = rest.split('"', 1)[0]
+            else:
+                record = json.loads(line)
+                entity, id = record["entity"], record["id"]
+            offsets[entity][id] = offset
+            offset += len(line)
+    return offsets
+
+
+def make_app(path, latency=0.0, error_rate=0.0):
+    print(f"Indexing {path}...")
+    start = time.time()
+    offsets = index_corpus(path)
+    print(f"Indexed {sum(len(ids) for ids in offsets.values())} IDs in {time.time() - start:.1f}s")
+    corpus = open(path, "rb")
+
+    def read_record(offset):
+        corpus.seek(offset)
+        return json.loads(corpus.readline())
+
+    async def entity_endpoint(request):
+        if latency:
+            await asyncio.sleep(latency)
+        if error_rate and random.random() < error_rate:
+            return web.json_response({"error": "synthetic failure"}, status=random.choice([429, 503]))
+
+        entity = request.match_info["entity"]
+        entity_offsets = offsets.get(entity, {})
+        filter_ = request.query.get("filter")
+        if not filter_:
+            return web.json_response({"meta": {"count": len(entity_offsets)}, "results": []})
+
+        side = "walden" if request.query.get("data-version") == "2" else "prod"
+        ids = filter_.split(":", 1)[1].split("|")
+        results = []
+        for id in ids:
+            offset = entity_offsets.get(id)
+            if offset is not None:
+                doc = read_record(offset)[side]
+                if doc is not None:
+                    results.append(doc)
+        return web.json_response({"meta": {"count": len(results)}, "results": results})
+
+    app = web.Application()
+    app.router.add_get("/{entity}", entity_endpoint)
+    return app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve a synthetic corpus as a stand-in for the OpenAlex API")
+    parser.add_argument('corpus', help="Uncompressed corpus file from benchmarks/synthetic_corpus.py")
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds to delay every response")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of requests answered with a 429 or 503")
+    args = parser.parse_args()
+
+    web.run_app(make_app(args.corpus, args.latency, args.error_rate), port=args.port)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Measure API startup: import time, gunicorn boot, worker respawn and cold-request latency.
+
+For each mode (gunicorn.conf.py with GUNICORN_PRELOAD=True and =False) a single-worker gunicorn is
+started against DATABASE_URL and timed until it first answers. Then each endpoint of
+benchmarks/api_concurrency.py is requested once cold, the first request its worker serves, and
+--warm more times. Finally the worker is killed and the time until its replacement answers is
+the worker boot time: a fork with preload, a fork plus every import without.
+
+    python benchmarks/startup.py --runs 5 --json startup.json
+"""
+
+import argparse
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+from api_concurrency import ENDPOINTS
+
+IMPORT_SNIPPET = "import time; start = time.perf_counter(); import views; print(time.perf_counter() - start)"
+MODES = {"preload": "True", "no-preload": "False"}
+BOOT_TIMEOUT = 60
+
+
+def import_seconds():
+    """Seconds to import the app in a fresh interpreter, as a worker without preload does."""
+    output = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def get(url):
+    """Seconds taken by a GET of url, or None when it fails."""
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=30) as response:
+            response.read()
+    except (urllib.error.URLError, ConnectionError):
+        return None
+    return time.perf_counter() - start
+
+
+def wait_until_up(base_url, started):
+    while time.perf_counter() - started < BOOT_TIMEOUT:
+        if get(base_url + "/") is not None:
+            return time.perf_counter() - started
+        time.sleep(0.005)
+    raise RuntimeError(f"{base_url} did not answer within {BOOT_TIMEOUT}s")
+
+
+def worker_pid(master_pid):
+    output = subprocess.run(["pgrep", "-P", str(master_pid)], capture_output=True, text=True).stdout.split()
+    return int(output[0]) if output else None
+
+
+def run_mode(preload, port, warm):
+    base_url = f"http://127.0.0.1:{port}"
+    env = dict(os.environ, GUNICORN_PRELOAD=preload, GUNICORN_WORKER_CLASS="sync", WEB_CONCURRENCY="1")
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "views:app", "-b", f"127.0.0.1:{port}", "-w", "1"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        result = {"boot_seconds": wait_until_up(base_url, started), "cold_ms": {}, "warm_ms": {}}
+        for name, path in ENDPOINTS.items():
+            cold = get(base_url + path)
+            warm_times = [get(base_url + path) for _ in range(warm)]
+            result["cold_ms"][name] = cold * 1000 if cold is not None else None
+            result["warm_ms"][name] = statistics.median(t for t in warm_times if t is not None) * 1000 if any(warm_times) else None
+
+        # Kill the worker and time until the master's replacement answers
+        pid = worker_pid(server.pid)
+        killed = time.perf_counter()
+        os.kill(pid, signal.SIGKILL)
+        while worker_pid(server.pid) in (pid, None):
+            time.sleep(0.001)
+        result["respawn_seconds"] = wait_until_up(base_url, killed)
+        return result
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def median_of(runs, *keys):
+    values = []
+    for run in runs:
+        value = run
+        for key in keys:
+            value = value[key]
+        if value is not None:
+            values.append(value)
+    return statistics.median(values) if values else None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure API import, boot, worker respawn and cold-request latency")
+    parser.add_argument('--runs', type=int, default=3, help="Runs per mode; medians are reported")
+    parser.add_argument('--warm', type=int, default=5, help="Warm requests per endpoint after the cold one")
+    parser.add_argument('--port', type=int, default=5107)
+    parser.add_argument('--modes', default=",".join(MODES), help="Comma-separated modes: " + ", ".join(MODES))
+    parser.add_argument('--json', help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    imports = [import_seconds() for _ in range(args.runs)]
+    print(f"import views: median {statistics.median(imports) * 1000:.0f} ms over {args.runs} runs")
+
+    results = {"import_seconds": imports, "modes": {}}
+    for mode in args.modes.split(","):
+        runs = [run_mode(MODES[mode], args.port, args.warm) for _ in range(args.runs)]
+        results["modes"][mode] = runs
+        print(f"\n{mode}: boot {median_of(runs, 'boot_seconds') * 1000:.0f} ms, worker respawn {median_of(runs, 'respawn_seconds') * 1000:.0f} ms")
+        print(f"{'endpoint':<22} {'cold ms':>9} {'warm ms':>9}")
+        for name in ENDPOINTS:
+            cold, warm = median_of(runs, "cold_ms", name), median_of(runs, "warm_ms", name)
+            print(f"{name:<22} {cold if cold is not None else float('nan'):>9.1f} {warm if warm is not None else float('nan'):>9.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
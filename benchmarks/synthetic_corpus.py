@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Generate a synthetic prod/walden corpus for scale testing.
+
+Writes one JSON line per ID, {"entity", "id", "prod", "walden"}, with documents built from seed
+documents (a JSON list or JSON Lines file of real API results, or benchmarks/fixtures.py when
+none are given). Each field read by the entity's tests in tests_schema is changed in the walden
+copy at a controlled rate, so the expected match rate of every test is known in advance.
+
+The corpus can be read offline by `run_metrics.py --corpus`, or served by
+benchmarks/stand_in_api.py for a full run including fetching (serve an uncompressed file). That
+run reads the IDs saved with --sample, which are kept apart from real samples in the "synthetic"
+scope.
+
+    python benchmarks/synthetic_corpus.py --entity works --count 1000000 --out corpus.jsonl \\
+        --rate 0.05 --field-rate 'authorships[*].institutions[*].id=0.2' --sample Synthetic1M
+"""
+
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schema import entities, tests_schema
+
+from fixtures import OPENALEX, make_doc
+
+ID_PREFIXES = {
+    "works": "W", "authors": "A", "sources": "S", "institutions": "I", "publishers": "P",
+    "funders": "F", "topics": "T", "concepts": "C", "awards": "G",
+}
+# Scope of samples saved with --sample: real runs and the API only read their own scope ("all" by
+# default), so a synthetic sample never replaces the latest real one
+SAMPLE_SCOPE = "synthetic"
+# Added as the base of generated numeric IDs, so they never collide with real ones
+SYNTHETIC_ID_BASE = 9_000_000_000
+
+
+def synthetic_id(entity, i):
+    prefix = ID_PREFIXES.get(entity)
+    return f"{prefix}{SYNTHETIC_ID_BASE + i}" if prefix else f"{entity}/synthetic-{i}"
+
+
+def load_seeds(path):
+    with open(path) as f:
+        text = f.read()
+    if text.lstrip().startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def test_fields(entity):
+    """Distinct fields read by the entity's tests, with the field_type of the first test using each."""
+    fields = {}
+    for test in tests_schema[entity]:
+        fields.setdefault(test["field"], test.get("field_type"))
+    return fields
+
+
+def changed_value(value, field_type, rng):
+    """A different value of the same kind, or None / a new value when added or lost."""
+    if value is None:
+        return {
+            "number": rng.randrange(1, 100),
+            "boolean": True,
+            "array": [f"{OPENALEX}X{rng.randrange(10 ** 9)}"],
+            "object": {"synthetic": True},
+        }.get(field_type, f"synthetic-{rng.randrange(10 ** 6)}")
+    if isinstance(value, bool):
+        return not value
+    if isinstance(value, (int, float)):
+        if rng.random() < 0.1:
+            return None
+        changed = value * rng.uniform(0.5, 1.5) + rng.choice([-3, -1, 1, 3])
+        return max(0, round(changed) if isinstance(value, int) else round(changed, 3))
+    if isinstance(value, str):
+        return None if rng.random() < 0.25 else f"{value}-changed"
+    if isinstance(value, list):
+        if value and rng.random() < 0.5:
+            changed = list(value)
+            del changed[rng.randrange(len(changed))]
+            return changed
+        extra = f"{OPENALEX}X{rng.randrange(10 ** 9)}" if not value or isinstance(value[0], str) else dict(value[0])
+        return value + [extra]
+    return None
+
+
+def change_field(doc, field, field_type, rng):
+    """Change the value at a tests_schema field path in doc; [*] picks one random list item."""
+    parts = field.split(".")
+    container = doc
+    for part in parts[:-1]:
+        key = part.replace("[*]", "")
+        container = container.get(key) if isinstance(container, dict) else None
+        if part.endswith("[*]"):
+            container = rng.choice(container) if isinstance(container, list) and container else None
+        if container is None:
+            return
+
+    if isinstance(container, dict):
+        container[parts[-1]] = changed_value(container.get(parts[-1]), field_type, rng)
+
+
+def generate(entity, count, seeds, rate, field_rates, missing, seed, ids=None):
+    """Yield corpus records for count generated IDs of entity, or for the given ids."""
+    rng = random.Random(f"{entity}-{seed}")
+    seed_texts = [json.dumps(doc) for doc in seeds] if seeds else None
+    fields = test_fields(entity)
+
+    for i, id in enumerate(ids or (synthetic_id(entity, i) for i in range(count))):
+        # Copying through JSON is much faster than copy.deepcopy at this scale
+        prod = json.loads(seed_texts[i % len(seed_texts)]) if seed_texts else make_doc(entity, i, rng)
+        prod["id"] = f"{OPENALEX}{id}"
+        if isinstance(prod.get("ids"), dict):
+            prod["ids"]["openalex"] = prod["id"]
+
+        if rng.random() < missing:
+            walden = None
+        else:
+            walden = json.loads(json.dumps(prod))
+            for field, field_type in fields.items():
+                if rng.random() < field_rates.get(field, rate):
+                    change_field(walden, field, field_type, rng)
+
+        yield {"entity": entity, "id": id, "prod": prod, "walden": walden}
+
+
+def parse_field_rates(values):
+    rates = {}
+    for value in values or []:
+        field, _, rate = value.rpartition("=")
+        rates[field] = float(rate)
+    return rates
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic prod/walden corpus")
+    parser.add_argument('--entity', action='append', choices=entities, help="Entity to generate; may be repeated (default works)")
+    parser.add_argument('--count', type=int, default=10000, help="Pairs per entity")
+    parser.add_argument('--out', required=True, help="Output JSON Lines file; gzipped when it ends in .gz")
+    parser.add_argument('--seeds', help="JSON list or JSON Lines file of seed documents of the entity (default: built-in fixtures)")
+    parser.add_argument('--rate', type=float, default=0.05, help="Share of pairs in which each test field differs")
+    parser.add_argument('--field-rate', action='append', metavar="FIELD=RATE", help="Divergence rate for one tests_schema field; may be repeated")
+    parser.add_argument('--missing', type=float, default=0.02, help="Share of IDs with no walden document")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed")
+    parser.add_argument('--sample', help=f"Also save the generated IDs as a '{SAMPLE_SCOPE}' scope 'both' sample with this name (needs DATABASE_URL)")
+    args = parser.parse_args()
+
+    seeds = load_seeds(args.seeds) if args.seeds else None
+    field_rates = parse_field_rates(args.field_rate)
+    opener = gzip.open if args.out.endswith(".gz") else open
+
+    ids = {}
+    with opener(args.out, "wt") as f:
+        for entity in args.entity or ["works"]:
+            ids[entity] = []
+            for record in generate(entity, args.count, seeds, args.rate, field_rates, args.missing, args.seed):
+                f.write(json.dumps(record, separators=(",", ":")))
+                f.write("\n")
+                ids[entity].append(record["id"])
+            print(f"Wrote {args.count} {entity} pairs to {args.out}")
+
+    if args.sample:
+        from make_sample import save_sample
+        for entity, entity_ids in ids.items():
+            name = args.sample if len(ids) == 1 else f"{args.sample}-{entity}"
+            save_sample(name, entity, "both", SAMPLE_SCOPE, entity_ids)
+
+
+if __name__ == '__main__':
+    main()
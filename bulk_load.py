@@ -0,0 +1,138 @@
+import csv
+import hashlib
+import io
+import json
+import os
+
+from sqlalchemy import or_, text
+from sqlalchemy.dialects.postgresql import insert
+
+from app import db
+from models import Document, Response
+
+RESPONSE_COLUMNS = ['id', 'entity', 'date', 'prod', 'walden', 'match', 'digest', 'prod_hash', 'walden_hash']
+JSON_COLUMNS = ['prod', 'walden', 'match']
+# skip_unchanged still rewrites a row when one of these differs: its content digest, or the
+# document hashes of a row moving into or out of the documents table with unchanged content
+SKIP_COMPARED_COLUMNS = ['digest', 'prod_hash', 'walden_hash']
+
+
+def response_digest(prod, walden, match):
+    """Stable digest of a response's content; equal digests mean the stored row would not change."""
+    content = json.dumps([prod, walden, match], sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def rewrite_condition(table, excluded):
+    """ON CONFLICT ... WHERE condition of skip_unchanged, true for the rows to rewrite."""
+    return or_(*(table.c[column].is_distinct_from(excluded[column]) for column in SKIP_COMPARED_COLUMNS))
+
+
+def upsert_responses_insert(session, rows, table=Response.__table__, chunk_size=1000, skip_unchanged=False):
+    """
+    Upsert rows with multi-VALUES INSERT ... ON CONFLICT statements, committing each chunk.
+    With skip_unchanged, existing rows with the same digest and document hashes are left untouched.
+    Returns the number of rows written.
+    """
+    total_records = len(rows)
+    total_chunks = (total_records + chunk_size - 1) // chunk_size
+    written = 0
+    print(f"Processing {total_records} records in chunks of {chunk_size}")
+
+    for i in range(0, total_records, chunk_size):
+        chunk = rows[i:i + chunk_size]
+        chunk_num = (i // chunk_size) + 1
+
+        print(f"Processing chunk {chunk_num}/{total_chunks} ({len(chunk)} records)")
+
+        # PostgreSQL UPSERT for this chunk
+        stmt = insert(table).values(chunk)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['id'],
+            set_={column: stmt.excluded[column] for column in RESPONSE_COLUMNS if column != 'id'},
+            where=rewrite_condition(table, stmt.excluded) if skip_unchanged else None
+        )
+        written += session.execute(stmt).rowcount
+
+        # Commit each chunk to avoid long-running transactions
+        session.commit()
+
+    return written
+
+
+def _copy_value(column, value):
+    if column in JSON_COLUMNS:
+        # Matches the insert path, which stores None as a JSON null rather than SQL NULL
+        return json.dumps(value)
+    if value is None:
+        return None
+    return value.isoformat() if column == 'date' else value
+
+
+def upsert_responses_copy(rows, table_name="responses", chunk_size=10000, skip_unchanged=False):
+    """
+    Upsert rows by streaming them through COPY into an unlogged staging table, then merging
+    into table_name with a single INSERT ... ON CONFLICT.
+    With skip_unchanged, existing rows with the same digest and document hashes are left untouched.
+    Returns the number of rows written.
+    """
+    staging_table = f"{table_name}_staging_{os.getpid()}"
+    update_columns = [column for column in RESPONSE_COLUMNS if column != 'id']
+
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"DROP TABLE IF EXISTS {staging_table}")
+        cursor.execute(f"CREATE UNLOGGED TABLE {staging_table} (LIKE {table_name} INCLUDING DEFAULTS)")
+
+        print(f"Copying {len(rows)} records into {staging_table}")
+        copy_sql = f"COPY {staging_table} ({', '.join(RESPONSE_COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+        for i in range(0, len(rows), chunk_size):
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for row in rows[i:i + chunk_size]:
+                writer.writerow([_copy_value(column, row.get(column)) for column in RESPONSE_COLUMNS])
+            buffer.seek(0)
+            cursor.copy_expert(copy_sql, buffer)
+
+        print(f"Merging {staging_table} into {table_name}")
+        # DISTINCT ON keeps a single row per id, ON CONFLICT cannot update the same row twice
+        cursor.execute(f"""
+            INSERT INTO {table_name} ({', '.join(RESPONSE_COLUMNS)})
+            SELECT DISTINCT ON (id) {', '.join(RESPONSE_COLUMNS)}
+            FROM {staging_table}
+            ORDER BY id
+            ON CONFLICT (id) DO UPDATE SET
+            {', '.join(f'{column} = excluded.{column}' for column in update_columns)}
+            {f"WHERE ({' OR '.join(f'{table_name}.{column} IS DISTINCT FROM excluded.{column}' for column in SKIP_COMPARED_COLUMNS)})" if skip_unchanged else ''}
+        """)
+        written = cursor.rowcount
+        cursor.execute(f"DROP TABLE {staging_table}")
+        connection.commit()
+        return written
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+
+def upsert_documents(session, documents, chunk_size=1000):
+    """Insert content-addressed documents, skipping hashes that are already stored. Returns the number inserted."""
+    inserted = 0
+    for i in range(0, len(documents), chunk_size):
+        stmt = insert(Document).values(documents[i:i + chunk_size]).on_conflict_do_nothing(index_elements=['hash'])
+        inserted += session.execute(stmt).rowcount
+        session.commit()
+    return inserted
+
+
+def prune_documents(session):
+    """Delete documents no longer referenced by any response. Returns the number deleted."""
+    deleted = session.execute(text("""
+        DELETE FROM documents d
+        WHERE NOT EXISTS (SELECT 1 FROM responses r WHERE r.prod_hash = d.hash)
+        AND NOT EXISTS (SELECT 1 FROM responses r WHERE r.walden_hash = d.hash)
+    """)).rowcount
+    session.commit()
+    return deleted
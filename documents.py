@@ -0,0 +1,78 @@
+"""
+Content-addressed storage for prod and walden documents.
+
+When enabled in save_data, each distinct document is stored once in the documents table, keyed by
+the hash of its canonical JSON, and responses reference it through prod_hash / walden_hash instead
+of holding their own copy. Documents are kept either as JSONB (so the API can still project
+subfields in SQL) or as zstd-compressed JSON, which is smaller but rehydrated in Python on read.
+"""
+
+import hashlib
+import json
+import threading
+
+DOCUMENT_ENCODINGS = ["json", "zstd"]
+COMPRESSION_LEVEL = 10
+
+# zstandard compressors and decompressors are costly to create and not thread-safe, so each
+# thread (API threads included) creates one of each on first use and reuses it
+zstd_contexts = threading.local()
+
+
+def document_hash(doc):
+    content = json.dumps(doc, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def compress_document(doc):
+    compressor = getattr(zstd_contexts, "compressor", None)
+    if compressor is None:
+        import zstandard
+        compressor = zstd_contexts.compressor = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL)
+    return compressor.compress(json.dumps(doc, separators=(",", ":")).encode("utf-8"))
+
+
+def decompress_document(zdoc):
+    decompressor = getattr(zstd_contexts, "decompressor", None)
+    if decompressor is None:
+        import zstandard
+        decompressor = zstd_contexts.decompressor = zstandard.ZstdDecompressor()
+    return json.loads(decompressor.decompress(bytes(zdoc)))
+
+
+def document_path(doc, path):
+    """Python equivalent of the jsonb #> operator, used for documents stored compressed."""
+    value = doc
+    for key in path:
+        if isinstance(value, dict):
+            value = value.get(key)
+        elif isinstance(value, list) and key.lstrip("-").isdigit() and -len(value) <= int(key) < len(value):
+            value = value[int(key)]
+        else:
+            return None
+    return value
+
+
+def externalize_documents(rows, encoding="json"):
+    """
+    Move the prod and walden documents of response rows into a dict of document rows keyed by hash,
+    leaving prod_hash / walden_hash references behind. Identical documents, including a prod and
+    walden pair that did not change, are stored once. Returns the document rows to upsert.
+    """
+    documents = {}
+    for row in rows:
+        for side in ("prod", "walden"):
+            doc = row[side]
+            if doc is None:
+                row[f"{side}_hash"] = None
+                continue
+            hash_ = document_hash(doc)
+            if hash_ not in documents:
+                documents[hash_] = {
+                    'hash': hash_,
+                    'doc': doc if encoding == "json" else None,
+                    'zdoc': compress_document(doc) if encoding == "zstd" else None,
+                }
+            row[side] = None
+            row[f"{side}_hash"] = hash_
+    return list(documents.values())
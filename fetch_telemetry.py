@@ -0,0 +1,80 @@
+"""
+Per-request telemetry for fetching samples from the API.
+
+Every attempt records its latency, status (an HTTP status, "timeout" or "error") and response
+bytes, along with the time it waited in RateLimiter.acquire. Every ID group records how many
+attempts it took, and groups that still failed after their retries are kept with their IDs, so
+they can be listed at the end of a run and retried.
+"""
+
+from collections import Counter, defaultdict
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list, or None when it is empty."""
+    if not sorted_values:
+        return None
+    rank = max(1, round(p / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def distribution_ms(seconds):
+    values = sorted(seconds)
+    return {
+        "count": len(values),
+        "total_seconds": round(sum(values), 3),
+        "p50_ms": _ms(percentile(values, 50)),
+        "p95_ms": _ms(percentile(values, 95)),
+        "p99_ms": _ms(percentile(values, 99)),
+        "max_ms": _ms(values[-1] if values else None),
+    }
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+class FetchTelemetry:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.rate_limit_waits = []
+        self.statuses = defaultdict(Counter)
+        self.bytes = defaultdict(int)
+        self.attempts = Counter()
+        self.failed_groups = []
+
+    def record_wait(self, seconds):
+        """Record time spent waiting in RateLimiter.acquire before one attempt."""
+        self.rate_limit_waits.append(seconds)
+
+    def record_request(self, side, status, seconds, bytes_=0):
+        """Record one attempt against the prod or walden API."""
+        self.latencies[side].append(seconds)
+        self.statuses[side][str(status)] += 1
+        self.bytes[side] += bytes_
+
+    def record_group(self, entity, side, ids, attempts, status):
+        """Record the outcome of one ID group; status is that of its last attempt."""
+        self.attempts[attempts] += 1
+        if status != 200:
+            self.failed_groups.append({"entity": entity, "side": side, "status": str(status), "attempts": attempts, "ids": list(ids)})
+
+    def failed_ids(self, entity):
+        return {id for group in self.failed_groups if group["entity"] == entity for id in group["ids"]}
+
+    def summary(self):
+        sides = sorted(self.latencies)
+        requests = sum(len(self.latencies[side]) for side in sides)
+        groups = sum(self.attempts.values())
+        return {
+            "requests": requests,
+            "groups": groups,
+            "retries": requests - groups,
+            "attempts_per_group": {str(attempts): count for attempts, count in sorted(self.attempts.items())},
+            "latency": {side: distribution_ms(self.latencies[side]) for side in sides},
+            "statuses": {side: dict(sorted(self.statuses[side].items())) for side in sides},
+            "rate_limited": sum(self.statuses[side]["429"] for side in sides),
+            "bytes": dict(sorted(self.bytes.items())),
+            "rate_limit_wait": distribution_ms(self.rate_limit_waits),
+            "failed_groups": self.failed_groups,
+        }
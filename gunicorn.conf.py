@@ -0,0 +1,50 @@
+"""
+Gunicorn settings, loaded automatically from the working directory by `gunicorn views:app`.
+
+GUNICORN_WORKER_CLASS picks the serving mode:
+  - sync (default): one request per worker at a time
+  - gthread: GUNICORN_THREADS requests per worker, no extra dependencies
+  - gevent: GUNICORN_WORKER_CONNECTIONS greenlets per worker, needs `pip install gevent psycogreen`
+
+db.session is scoped to the current greenlet (or thread when greenlet is missing), so every
+concurrent request gets its own session in all three modes. WEB_CONCURRENCY still sets the worker count.
+sync stays the default: see benchmarks/api_concurrency_results.md for what the other modes have been
+measured to gain, so far on a single core only.
+
+Set PROMETHEUS_MULTIPROC_DIR so /metrics reports all workers rather than the one serving it.
+
+The app is imported once in the master and forked into the workers (preload_app), so the imports,
+tests_schema and the compressed /schema bodies are built once rather than in every worker, and a
+worker boots in the time it takes to fork. Nothing connects to the database at import, so no
+connection is shared across the fork. GUNICORN_PRELOAD=False turns this off; it is off by default
+with gevent, whose monkey-patching must happen before the app is imported.
+"""
+import os
+
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "sync")
+threads = int(os.getenv("GUNICORN_THREADS", 8 if worker_class == "gthread" else 1))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 100))
+preload_app = os.getenv("GUNICORN_PRELOAD", str(worker_class != "gevent")) == "True"
+
+
+def on_starting(server):
+    # Samples left over from a previous run would be aggregated into /metrics forever
+    multiproc_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if multiproc_dir:
+        os.makedirs(multiproc_dir, exist_ok=True)
+        for name in os.listdir(multiproc_dir):
+            if name.endswith(".db"):
+                os.remove(os.path.join(multiproc_dir, name))
+
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def post_fork(server, worker):
+    if worker_class == "gevent":
+        # psycopg2 blocks the whole worker unless it yields to the gevent hub while waiting on Postgres
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
@@ -0,0 +1,105 @@
+"""
+Optional per-run history of response matches, in a table partitioned by month of run date.
+Only rows that save_data actually wrote (new or changed content) are recorded, plus a baseline
+row for every response without any history yet, and retention works by dropping whole monthly
+partitions.
+"""
+
+from datetime import date
+
+from sqlalchemy import text
+
+HISTORY_TABLE = "response_history"
+
+
+def month_start(day, months_ahead=0):
+    month_index = day.year * 12 + day.month - 1 + months_ahead
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def partition_name(day):
+    return f"{HISTORY_TABLE}_{day.year:04d}{day.month:02d}"
+
+
+def ensure_history_partition(session, run_date):
+    """Create the partitioned history table and the partition covering run_date, if missing."""
+    session.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {HISTORY_TABLE} (
+            id text NOT NULL,
+            entity text,
+            run_date date NOT NULL,
+            digest text,
+            match jsonb,
+            PRIMARY KEY (id, run_date)
+        ) PARTITION BY RANGE (run_date)
+    """))
+    start = month_start(run_date)
+    session.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {partition_name(start)} PARTITION OF {HISTORY_TABLE}
+        FOR VALUES FROM ('{start.isoformat()}') TO ('{month_start(start, 1).isoformat()}')
+    """))
+
+
+def record_history(session, run_time):
+    """
+    Copy the responses written by this run into the history. Unchanged responses are skipped by
+    the upsert and keep their previous date, so matching on date = run_time selects only new or
+    changed rows. Responses with no history row at all, every response on the first run with
+    history and those whose rows were all pruned since, are recorded too, so each has a baseline
+    its later transitions start from. Returns the number of history rows recorded.
+    """
+    ensure_history_partition(session, run_time.date())
+    recorded = session.execute(text(f"""
+        INSERT INTO {HISTORY_TABLE} (id, entity, run_date, digest, match)
+        SELECT r.id, r.entity, CAST(:run_time AS date), r.digest, r.match
+        FROM responses r
+        WHERE r.date = :run_time
+        OR NOT EXISTS (SELECT 1 FROM {HISTORY_TABLE} h WHERE h.id = r.id)
+        ON CONFLICT (id, run_date) DO UPDATE SET
+        entity = excluded.entity, digest = excluded.digest, match = excluded.match
+    """), {'run_time': run_time}).rowcount
+    session.commit()
+    return recorded
+
+
+def prune_history(session, keep_months):
+    """Drop every monthly partition that ends more than keep_months months ago. Returns the dropped names."""
+    cutoff = month_start(date.today(), -keep_months)
+    partitions = session.execute(text("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = :table
+    """), {'table': HISTORY_TABLE}).scalars().all()
+
+    dropped = []
+    for name in sorted(partitions):
+        suffix = name[len(HISTORY_TABLE) + 1:]
+        if len(suffix) != 6 or not suffix.isdigit():
+            continue
+        if month_start(date(int(suffix[:4]), int(suffix[4:]), 1), 1) <= cutoff:
+            session.execute(text(f"DROP TABLE {name}"))
+            dropped.append(name)
+    session.commit()
+    return dropped
+
+
+def match_transitions(rows):
+    """
+    Turn history rows (run_date, match), ordered by run_date, into the test results that changed
+    at each run. The first run reports every test, as changed from None.
+    """
+    transitions = []
+    previous = {}
+    for row in rows:
+        current = {key: value for key, value in (row.match or {}).items() if not key.startswith("_")}
+        changes = {
+            key: {"from": previous.get(key), "to": value}
+            for key, value in current.items()
+            if key not in previous or previous[key] != value
+        }
+        if changes:
+            transitions.append({"run_date": row.run_date.isoformat(), "changes": changes})
+        previous = current
+    return transitions
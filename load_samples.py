@@ -2,17 +2,173 @@
 
 import json
 import os
+import re
 import argparse
 from datetime import datetime
 from dotenv import load_dotenv
 
 load_dotenv()
 
+from sqlalchemy.dialects.postgresql import insert
+
 from app import app, db
-from models import Sample
+from models import Sample, encode_ids
+
+BULK_BATCH_SIZE = 50
+WHITESPACE = re.compile(r'\s*')
+
+
+def iter_samples(path, read_size=1 << 16):
+    """
+    Yield (key, sample) pairs from the top-level JSON object in path, decoding one sample at a
+    time, so memory is bounded by the largest sample rather than the whole file.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r') as f:
+        buffer = ""
+        pos = 0
+        eof = False
+
+        def skip_whitespace():
+            nonlocal buffer, pos, eof
+            while True:
+                while pos < len(buffer) and buffer[pos].isspace():
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    return
+                buffer, pos = f.read(read_size), 0
+                eof = not buffer
+
+        def decode():
+            # Read more until the next complete JSON value is in the buffer. raw_decode also accepts
+            # a number cut off by the end of the buffer ("12" of "12345", "1" of "1.5"), so a value
+            # only counts as complete once the ':', ',' or '}' after it is in the buffer too, or the
+            # file is exhausted.
+            nonlocal buffer, pos, eof
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                    follows = WHITESPACE.match(buffer, end).end()
+                    if eof or buffer[follows:follows + 1] in (':', ',', '}'):
+                        pos = end
+                        return value
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                more = f.read(read_size)
+                eof = not more
+                buffer = buffer[pos:] + more
+                pos = 0
+
+        def expect(char):
+            nonlocal pos
+            skip_whitespace()
+            if buffer[pos:pos + 1] != char:
+                raise ValueError(f"Expected '{char}' in {path}")
+            pos += 1
+
+        expect('{')
+        skip_whitespace()
+        if buffer[pos:pos + 1] == '}':
+            return
+        while True:
+            skip_whitespace()
+            key = decode()
+            expect(':')
+            skip_whitespace()
+            yield key, decode()
+            skip_whitespace()
+            if buffer[pos:pos + 1] == ',':
+                pos += 1
+                continue
+            expect('}')
+            return
+
+
+def parse_sample_date(date_str, sample_key):
+    try:
+        # Try to parse the date (assuming format like "2025-07-21")
+        return datetime.strptime(date_str.strip(), '%Y-%m-%d')
+    except ValueError:
+        # If date parsing fails, use current date
+        print(f"Warning: Could not parse date '{date_str}' for sample '{sample_key}', using current date")
+        return datetime.now()
+
+
+def sample_row(sample_key, sample_data):
+    ids = sample_data.get('ids', [])
+    id_prefix, id_nums = encode_ids(ids)
+    return {
+        'name': sample_data.get('name', sample_key),  # Use key as fallback name
+        'entity': sample_data.get('entity', None),
+        'type': sample_data.get('type', None),
+        'scope': sample_data.get('scope', None),
+        'description': sample_data.get('description', ''),
+        'date': parse_sample_date(sample_data.get('date', ''), sample_key),
+        'ids': ids if id_nums is None else None,  # as in Sample.set_ids
+        'id_prefix': id_prefix,
+        'id_nums': id_nums,
+        'version': 1,
+    }
 
 
-def load_samples(selected_sample_name=None):
+def upsert_sample_rows(session, rows):
+    """Upsert a batch of sample rows with one INSERT ... ON CONFLICT (name) statement."""
+    stmt = insert(Sample).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['name'],
+        set_={
+            'entity': stmt.excluded.entity,
+            'type': stmt.excluded.type,
+            # Samples without a scope in the file keep the one already stored
+            'scope': db.func.coalesce(stmt.excluded.scope, Sample.scope),
+            'description': stmt.excluded.description,
+            'date': stmt.excluded.date,
+            'ids': stmt.excluded.ids,
+            'id_prefix': stmt.excluded.id_prefix,
+            'id_nums': stmt.excluded.id_nums,
+            # The date comes from the file and may not change, so the version tells caches the IDs did
+            'version': Sample.version + 1,
+        }
+    )
+    session.execute(stmt)
+
+
+def load_samples_bulk(samples_file, selected_sample_name=None):
+    """
+    Stream samples from samples_file and upsert them in batches of BULK_BATCH_SIZE, all in a
+    single transaction, instead of one lookup round trip per sample.
+    """
+    print(f"Streaming samples from {samples_file}...")
+    with app.app_context():
+        samples_loaded = 0
+        names = set()
+        batch = []
+        try:
+            for sample_key, sample_data in iter_samples(samples_file):
+                row = sample_row(sample_key, sample_data)
+                if selected_sample_name and row['name'] != selected_sample_name:
+                    continue
+                if row['name'] in names:
+                    # ON CONFLICT cannot touch the same row twice in one statement; the last one wins anyway
+                    upsert_sample_rows(db.session, batch)
+                    batch = []
+                names.add(row['name'])
+                batch.append(row)
+                samples_loaded += 1
+                if len(batch) >= BULK_BATCH_SIZE:
+                    upsert_sample_rows(db.session, batch)
+                    batch = []
+            if batch:
+                upsert_sample_rows(db.session, batch)
+            db.session.commit()
+            print(f"\nSuccessfully loaded {samples_loaded} samples into the database!")
+        except Exception as e:
+            print(f"Error loading samples: {e}")
+            db.session.rollback()
+
+
+def load_samples(selected_sample_name=None, bulk=False):
     """Load all samples from samples.json into the database."""
     
     # Get the path to samples.json (assuming it's in the same directory as this script)
@@ -23,6 +179,9 @@ def load_samples(selected_sample_name=None):
         print(f"Error: {samples_file} not found!")
         return
     
+    if bulk:
+        return load_samples_bulk(samples_file, selected_sample_name)
+    
     # Load the JSON data
     print(f"Loading samples from {samples_file}...")
     with open(samples_file, 'r') as f:
@@ -51,9 +210,9 @@ def load_samples(selected_sample_name=None):
                     entity=sample_data.get('entity', None),
                     type=sample_data.get('type', None),
                     description=sample_data.get('description', ''),
-                    date=date_obj,
-                    ids=sample_data.get('ids', [])  # JSON array will be stored as JSON
+                    date=date_obj
                 )
+                sample.set_ids(sample_data.get('ids', []))  # compact encoding, or the JSON array
                 
                 # Check if a sample with this name already exists
                 sample_name = sample_data.get('name', sample_key)
@@ -65,7 +224,7 @@ def load_samples(selected_sample_name=None):
                     existing_sample.type = sample_data.get('type', None)
                     existing_sample.description = sample_data.get('description', '')
                     existing_sample.date = date_obj
-                    existing_sample.ids = sample_data.get('ids', [])
+                    existing_sample.set_ids(sample_data.get('ids', []))
                     print(f"Updated existing sample: {sample_name}")
                 else:
                     # Add new sample to session
@@ -88,6 +247,7 @@ def load_samples(selected_sample_name=None):
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Load samples into the database.")
     parser.add_argument('--sample', type=str, help="Only load the sample with this name field.")
+    parser.add_argument('--bulk', action='store_true', help="Stream the file and upsert all samples in batched INSERT ... ON CONFLICT statements in one transaction.")
     args = parser.parse_args()
 
-    load_samples(selected_sample_name=args.sample)
\ No newline at end of file
+    load_samples(selected_sample_name=args.sample, bulk=args.bulk)
\ No newline at end of file
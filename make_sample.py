@@ -157,9 +157,9 @@ def save_sample(sample_name, entity_type, sample_type, sample_scope, ids):
                 entity=entity_type,
                 type=sample_type,
                 scope=sample_scope,
-                date=date_obj,
-                ids=ids
+                date=date_obj
             )
+            sample.set_ids(ids)
             
             # Check if a sample with this name already exists
             existing_sample = Sample.query.filter_by(name=sample_name).first()
@@ -169,7 +169,7 @@ def save_sample(sample_name, entity_type, sample_type, sample_scope, ids):
                 existing_sample.entity = entity_type
                 existing_sample.type = sample_type
                 existing_sample.date = date_obj
-                existing_sample.ids = ids
+                existing_sample.set_ids(ids)
                 print(f"Updated existing sample: {sample_name}")
             else:
                 # Add new sample to session
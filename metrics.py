@@ -1,22 +1,32 @@
 import aiohttp
 import asyncio
+import gzip
+import json
 import os
 import time
 import random
 from datetime import datetime
+from itertools import islice
 from math import ceil
 from contextlib import contextmanager
 from email.utils import parsedate_to_datetime
 from collections import defaultdict, deque
 from pprint import pprint
 
-from models import Sample, MetricSet, Response
+from models import Sample, MetricSet, ids_from_columns
 from app import db
 from schema import tests_schema, entities, is_set_test, get_test_keys
+from bulk_load import upsert_responses_insert, upsert_responses_copy, response_digest, upsert_documents, prune_documents
+from documents import externalize_documents
+from history import record_history, prune_history
+from run_report import RunReport
+from fetch_telemetry import FetchTelemetry
+from results_store import ResultsStore
 
 OPENALEX_API_KEY = os.getenv("OPENALEX_API_KEY")
 
-api_endpoint = "https://api.openalex.org/"
+# OPENALEX_API_URL points runs at another API, such as benchmarks/stand_in_api.py
+api_endpoint = os.getenv("OPENALEX_API_URL", "https://api.openalex.org/")
 
 samples = defaultdict(dict)
 prod_results = defaultdict(dict)
@@ -26,7 +36,12 @@ match_rates = defaultdict(dict)
 coverage = defaultdict(dict)
 
 MAX_REQUESTS_PER_SECOND = 50
+# Responses built, externalized and upserted at a time by save_data, so a run with --memory-budget
+# never holds more than this many rows of documents in memory
+SAVE_CHUNK_SIZE = 1000
 rate_limiter = None
+run_report = None
+fetch_telemetry = None
 headers = {'Authorization': f'Bearer {OPENALEX_API_KEY}'}
 
 
@@ -89,10 +104,16 @@ async def fetch_ids(session, ids, entity, store, is_v2):
     max_retries = 5
     base_delay = 1  # Start with 1 second
     max_delay = 60  # Cap at 60 seconds
+    side = "walden" if is_v2 else "prod"
     
     for attempt in range(max_retries + 1):
+        status = None
         # Acquire rate limit permission
+        wait_started = time.perf_counter()
         await rate_limiter.acquire()
+        request_started = time.perf_counter()
+        if fetch_telemetry is not None:
+            fetch_telemetry.record_wait(request_started - wait_started)
         
         try:
             # Extract the part after the last "/" if present, otherwise use the full id
@@ -100,8 +121,14 @@ async def fetch_ids(session, ids, entity, store, is_v2):
             api_url = f"{api_endpoint}{entity}?filter={id_filter_field(entity)}:{'|'.join(short_ids)}&per_page=100{'&data-version=2' if is_v2 else ''}"
 
             async with session.get(api_url) as response:
+                body = await response.read() if response.status == 200 else b""
+                status = response.status
+                if fetch_telemetry is not None:
+                    fetch_telemetry.record_request(side, status, time.perf_counter() - request_started, len(body))
                 if response.status == 200:
-                    data = await response.json()
+                    data = json.loads(body)
+                    if run_report is not None:
+                        run_report.record_fetch(entity, side, request_started, len(data["results"]), len(body))
                     for result in data["results"]:
                         store[entity][extract_id(result["id"])] = result
                     returned_ids = [extract_id(result["id"]) for result in data["results"]]
@@ -109,6 +136,8 @@ async def fetch_ids(session, ids, entity, store, is_v2):
 
                     for id in missing_ids:
                         store[entity][id] = None
+                    if fetch_telemetry is not None:
+                        fetch_telemetry.record_group(entity, side, ids, attempt + 1, status)
                     return  # Success - exit retry loop
                 
                 elif response.status == 429:
@@ -163,6 +192,9 @@ async def fetch_ids(session, ids, entity, store, is_v2):
                     break  # Don't retry for other HTTP errors (400, 401, 403, etc.)
                     
         except asyncio.TimeoutError:
+            status = "timeout"
+            if fetch_telemetry is not None:
+                fetch_telemetry.record_request(side, status, time.perf_counter() - request_started)
             if attempt < max_retries:
                 delay = min(base_delay * (1.5 ** attempt), 10)
                 print(f"Timeout - retrying in {delay:.1f}s (attempt {attempt + 1}/{max_retries})")
@@ -173,6 +205,10 @@ async def fetch_ids(session, ids, entity, store, is_v2):
                 break
                 
         except Exception as e:
+            if status is None and fetch_telemetry is not None:
+                # Failed before a response arrived, such as a connection error
+                fetch_telemetry.record_request(side, "error", time.perf_counter() - request_started)
+            status = "error"
             print(f"Error fetching {entity} from {api_url}: {e}")
             break  # Don't retry for other exceptions
             
@@ -180,6 +216,34 @@ async def fetch_ids(session, ids, entity, store, is_v2):
             # Always release the semaphore, regardless of success or failure
             rate_limiter.release()
 
+    # Retries exhausted or not retryable: these IDs are left out of the run and listed at the end
+    if fetch_telemetry is not None:
+        fetch_telemetry.record_group(entity, side, ids, attempt + 1, status)
+
+
+def drop_unfetched_ids():
+    """
+    Remove IDs that failed to fetch for good from the samples, so they are neither counted as
+    missing from the API nor looked up in calc_matches. Returns the number dropped per entity.
+    """
+    dropped = {}
+    for entity, entity_samples in samples.items():
+        failed = fetch_telemetry.failed_ids(entity)
+        if not failed:
+            continue
+        # An ID may also be in a group that succeeded, as part of another sample of the entity
+        unfetched = {id for id in failed if id not in prod_results[entity] or id not in walden_results[entity]}
+        for sample in entity_samples.values():
+            sample["ids"] = [id for id in sample["ids"] if id not in unfetched]
+        dropped[entity] = len(unfetched)
+    return dropped
+
+
+def print_failed_groups():
+    print(f"Failed to fetch {len(fetch_telemetry.failed_groups)} ID groups after retries:")
+    for group in fetch_telemetry.failed_groups:
+        print(f"  {group['entity']} {group['side']} (status {group['status']}, {group['attempts']} attempts): {'|'.join(group['ids'])}")
+
 
 def extract_id(input_str):
     org_index = input_str.find('.org/')
@@ -221,8 +285,6 @@ def get_nested_strings(obj, field):
     - "authorships[*].institutions[*].id"
     - "authorships[*].countries"
     """
-    import re
-    
     def _parse_jsonpath(path):
         """Parse JSONPath into tokens, handling [*] syntax"""
         # Split on dots but preserve [*] markers
@@ -401,18 +463,20 @@ def calc_correlations():
     for entity in samples.keys():
         coverage[entity]["correlations"] = {}
         if "both" in samples[entity]:
-            for field in fields:
-                pairs = []
-                for id in samples[entity]["both"]["ids"]:
-                    prod_result = prod_results[entity].get(id, None)
-                    walden_result = walden_results[entity].get(id, None)
-                    if prod_result and walden_result:
+            # One pass over the documents for all fields, as they may be read back from disk
+            pairs = {field: [] for field in fields}
+            for id in samples[entity]["both"]["ids"]:
+                prod_result = prod_results[entity].get(id, None)
+                walden_result = walden_results[entity].get(id, None)
+                if prod_result and walden_result:
+                    for field in fields:
                         prod_value = prod_result.get(field, None)
                         walden_value = walden_result.get(field, None)
                         if prod_value and walden_value:
-                            pairs.append((prod_value, walden_value))
-                if len(pairs) > 1:
-                    coverage[entity]["correlations"][field] = calc_spearman_rho(pairs)
+                            pairs[field].append((prod_value, walden_value))
+            for field in fields:
+                if len(pairs[field]) > 1:
+                    coverage[entity]["correlations"][field] = calc_spearman_rho(pairs[field])
 
 
 def calc_spearman_rho(pairs):
@@ -490,8 +554,28 @@ def db_session():
         session.close()
 
 
-def save_data(scope="all"):
+def response_rows(current_time):
+    """Yield the response row of every ID in the "both" samples, reading its documents only when it is reached."""
+    for entity in entities:
+        if not "both" in samples[entity]:
+            continue
+        for id in samples[entity]["both"]["ids"]:
+            prod, walden, match = prod_results[entity][id], walden_results[entity][id], matches[entity][id]
+            yield {
+                'id': id,
+                'entity': entity,
+                'date': current_time,
+                'prod': prod,
+                'walden': walden,
+                'match': match,
+                'digest': response_digest(prod, walden, match)
+            }
+
+
+def save_data(scope="all", loader="insert", skip_unchanged=False, document_store=None, history_months=None):
     print("Saving data to database...")
+    # record_history finds the changed responses by their date, which only unchanged rows that were skipped keep
+    skip_unchanged = skip_unchanged or bool(history_months)
     start_time = time.time()
     with db_session() as session:
         coverage_data = dict(coverage)
@@ -512,53 +596,30 @@ def save_data(scope="all"):
             data=match_rates_data
         )
 
-        # Bulk upsert optimization for large datasets with chunking
-        from sqlalchemy.dialects.postgresql import insert
-        
-        # Prepare bulk data
+        # Upsert the responses a chunk at a time, each chunk's documents first
         current_time = datetime.now()
-        bulk_data = []
-        for entity in entities:
-            if not "both" in samples[entity]:
-                continue
-            for id in samples[entity]["both"]["ids"]:
-                bulk_data.append({
-                    'id': id,
-                    'entity': entity,
-                    'date': current_time,
-                    'prod': prod_results[entity][id],
-                    'walden': walden_results[entity][id],
-                    'match': matches[entity][id]
-                })
-        
-        # Process in chunks to avoid operational errors with large datasets
-        chunk_size = 1000
-        total_records = len(bulk_data)
-        print(f"Processing {total_records} records in chunks of {chunk_size}")
+        rows = response_rows(current_time)
+        total = written = stored_documents = 0
+        while chunk := list(islice(rows, SAVE_CHUNK_SIZE)):
+            if document_store:
+                stored_documents += upsert_documents(session, externalize_documents(chunk, encoding=document_store))
+            if loader == "copy":
+                written += upsert_responses_copy(chunk, skip_unchanged=skip_unchanged)
+            else:
+                written += upsert_responses_insert(session, chunk, skip_unchanged=skip_unchanged)
+            total += len(chunk)
+
+        if document_store:
+            print(f"Documents newly stored: {stored_documents} ({document_store})")
+        print(f"Responses written: {written}, skipped (unchanged): {total - written}")
+
+        if document_store:
+            print(f"Pruned {prune_documents(session)} unreferenced documents")
         
-        for i in range(0, total_records, chunk_size):
-            chunk = bulk_data[i:i + chunk_size]
-            chunk_num = (i // chunk_size) + 1
-            total_chunks = (total_records + chunk_size - 1) // chunk_size
-            
-            print(f"Processing chunk {chunk_num}/{total_chunks} ({len(chunk)} records)")
-            
-            # PostgreSQL UPSERT for this chunk
-            stmt = insert(Response).values(chunk)
-            stmt = stmt.on_conflict_do_update(
-                index_elements=['id'],
-                set_={
-                    'entity': stmt.excluded.entity,
-                    'date': stmt.excluded.date,
-                    'prod': stmt.excluded.prod,
-                    'walden': stmt.excluded.walden,
-                    'match': stmt.excluded.match
-                }
-            )
-            session.execute(stmt)
-            
-            # Commit each chunk to avoid long-running transactions
-            session.commit()
+        if history_months:
+            print(f"Recorded {record_history(session, current_time)} responses in response_history")
+            for partition in prune_history(session, keep_months=history_months):
+                print(f"Dropped expired history partition {partition}")
 
         # Save to database
         session.add(coverage_metric_set)
@@ -591,7 +652,7 @@ def get_latest_samples(type_, scope="all"):
 
         # Select only the columns we need; returns plain tuples
         latest_samples = (
-            session.query(Sample.entity, Sample.ids, Sample.type, Sample.name)
+            session.query(Sample.entity, *Sample.ids_columns(), Sample.type, Sample.name)
             .join(
                 latest_dates,
                 (Sample.entity == latest_dates.c.entity) &
@@ -602,46 +663,148 @@ def get_latest_samples(type_, scope="all"):
             .all()
         )
 
-        # latest_samples is now a list of tuples: [(entity, ids), ...]
-        return [{'entity': entity, 'ids': ids, 'type': type_, 'name': name} for entity, ids, type_, name in latest_samples]
+        # latest_samples is now a list of tuples: [(entity, id_list, ids, type, name), ...]
+        return [
+            {'entity': entity, 'ids': ids_from_columns(id_list, ids), 'type': type_, 'name': name}
+            for entity, id_list, ids, type_, name in latest_samples
+        ]
+
+
+def load_corpus(path):
+    """
+    Load the prod/walden pairs of a corpus written by benchmarks/synthetic_corpus.py instead of
+    fetching them. The IDs of each entity become its "both" sample. Returns the samples.
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    corpus_samples = {}
+    with opener(path, "rt") as f:
+        for line in f:
+            record = json.loads(line)
+            entity, id = record["entity"], record["id"]
+            if entity not in corpus_samples:
+                corpus_samples[entity] = {'entity': entity, 'ids': [], 'type': "both", 'name': f"corpus:{os.path.basename(path)}"}
+            corpus_samples[entity]["ids"].append(id)
+            prod_results[entity][id] = record["prod"]
+            walden_results[entity][id] = record["walden"]
+    return list(corpus_samples.values())
+
+
+def save_run_report(scope="all"):
+    with db_session() as session:
+        session.add(MetricSet(
+            type="run_report",
+            entity="all",
+            scope=scope,
+            date=datetime.now(),
+            data=run_report.to_dict()
+        ))
 
 
-async def run_metrics(test=False, scope="all"):
-    latest_samples = get_latest_samples(type_="prod", scope=scope)
-    latest_samples += get_latest_samples(type_="walden", scope=scope)
-    latest_samples += get_latest_samples(type_="both", scope=scope)
+async def run_metrics(test=False, scope="all", loader="insert", skip_unchanged=False, document_store=None, history_months=None, report_file=None, corpus=None, memory_budget=None, save_corpus=False):
+    """
+    Compare prod and walden for the latest samples of scope and save the results unless test is set.
+    A run over a synthetic corpus is always a test run, except when save_corpus asks for its results
+    to be saved, as benchmarks/load_fixture.py does to fill a load-test database.
+    """
+    global run_report, fetch_telemetry, prod_results, walden_results
+    if corpus and not save_corpus:
+        test = True
+    run_report = RunReport()
+    fetch_telemetry = FetchTelemetry()
+
+    results_store = None
+    if memory_budget:
+        # Documents go to a temporary SQLite file, with only memory_budget MB of them cached in memory
+        results_store = ResultsStore(memory_budget)
+        prod_results = results_store.side("prod")
+        walden_results = results_store.side("walden")
+        print(f"Keeping documents in {results_store.path}, caching up to {memory_budget} MB in memory")
+
+    if corpus:
+        # Offline run over a synthetic corpus: no samples from the database and no API requests
+        with run_report.phase("load_corpus") as phase:
+            latest_samples = load_corpus(corpus)
+            phase.docs = sum(len(sample["ids"]) for sample in latest_samples)
+            phase.bytes = os.path.getsize(corpus)
+    else:
+        with run_report.phase("load_samples") as phase:
+            latest_samples = get_latest_samples(type_="prod", scope=scope)
+            latest_samples += get_latest_samples(type_="walden", scope=scope)
+            latest_samples += get_latest_samples(type_="both", scope=scope)
+            phase.docs = sum(len(sample["ids"]) for sample in latest_samples)
 
     print("Using samples:", flush=True)
     for sample in latest_samples:
         print(f"{sample['name']} - {len(sample['ids'])}", flush=True)
         samples[sample["entity"]][sample["type"]] = sample
 
-    # Create tasks for all samples to run in parallel
-    tasks = []
-    for sample in latest_samples:
-        ids = sample["ids"]
-        entity = sample["entity"]
-        tasks.append(fetch_all_ids(ids, entity))
-    
-    # Execute all sample fetching in parallel
-    await asyncio.gather(*tasks)
+    if not corpus:
+        # Create tasks for all samples to run in parallel
+        tasks = []
+        for sample in latest_samples:
+            ids = sample["ids"]
+            entity = sample["entity"]
+            tasks.append(fetch_all_ids(ids, entity))
+        
+        # Execute all sample fetching in parallel
+        with run_report.phase("fetch") as phase:
+            await asyncio.gather(*tasks)
+            phase.docs = run_report.fetched_docs()
+            phase.bytes = run_report.fetched_bytes()
+        summary = fetch_telemetry.summary()
+        run_report.add_section("fetch_telemetry", summary)
+        for side, latency in summary["latency"].items():
+            print(f"Fetch {side}: {latency['count']} requests, p50 {latency['p50_ms']}ms, p95 {latency['p95_ms']}ms, p99 {latency['p99_ms']}ms, statuses {summary['statuses'][side]}")
+        print(f"Waited {summary['rate_limit_wait']['total_seconds']}s in the rate limiter, {summary['retries']} retries")
+
+        if fetch_telemetry.failed_groups:
+            print_failed_groups()
+            for entity, count in drop_unfetched_ids().items():
+                print(f"Left {count} unfetched {entity} IDs out of this run")
     
-    calc_matches()
-    calc_match_rates()
+    both_count = sum(len(samples[entity]["both"]["ids"]) for entity in entities if "both" in samples[entity])
+    with run_report.phase("calc_matches") as phase:
+        calc_matches()
+        phase.docs = both_count
+    with run_report.phase("calc_match_rates") as phase:
+        calc_match_rates()
+        phase.docs = both_count
 
     print("Matches Rates:")
     pprint(match_rates)
     
-    calc_all_coverage()
-    calc_field_sums()
-    calc_correlations()
+    with run_report.phase("coverage") as phase:
+        calc_all_coverage()
+        calc_field_sums()
+        phase.docs = sum(len(sample["ids"]) for sample in latest_samples if sample["type"] != "both") + 2 * both_count
+    with run_report.phase("correlations") as phase:
+        calc_correlations()
+        phase.docs = both_count
 
     print("Coverage:")
     pprint(coverage)
 
-    await get_entity_counts()
+    if not corpus:
+        with run_report.phase("entity_counts"):
+            await get_entity_counts()
 
 
     # Save data to database
     if not test:
-        save_data(scope=scope)
\ No newline at end of file
+        with run_report.phase("save") as phase:
+            save_data(scope=scope, loader=loader, skip_unchanged=skip_unchanged, document_store=document_store, history_months=history_months)
+            phase.docs = both_count
+
+    if results_store:
+        run_report.add_section("results_store", results_store.stats())
+        results_store.close()
+
+    if not test:
+        save_run_report(scope=scope)
+
+    report_json = run_report.to_json()
+    print("Run report:")
+    print(report_json)
+    if report_file:
+        with open(report_file, "w") as f:
+            f.write(report_json)
\ No newline at end of file
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+import argparse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from sqlalchemy import text
+
+from app import app, db
+from models import Sample, encode_ids  # also registers the tables with db.metadata
+
+# Idempotent DDL for tables that already exist; db.create_all() only creates missing tables.
+MIGRATIONS = [
+    "CREATE INDEX IF NOT EXISTS ix_samples_entity_type_scope_date ON samples (entity, type, scope, date)",
+    "CREATE INDEX IF NOT EXISTS ix_metric_sets_type_scope_date ON metric_sets (type, scope, date)",
+    "ALTER TABLE responses ADD COLUMN IF NOT EXISTS digest text",
+    "ALTER TABLE responses ADD COLUMN IF NOT EXISTS prod_hash text",
+    "ALTER TABLE responses ADD COLUMN IF NOT EXISTS walden_hash text",
+    "CREATE INDEX IF NOT EXISTS ix_responses_prod_hash ON responses (prod_hash)",
+    "CREATE INDEX IF NOT EXISTS ix_responses_walden_hash ON responses (walden_hash)",
+    "CREATE INDEX IF NOT EXISTS ix_responses_date ON responses (date)",
+    "ALTER TABLE samples ADD COLUMN IF NOT EXISTS id_prefix text",
+    "ALTER TABLE samples ADD COLUMN IF NOT EXISTS id_nums bigint[]",
+    "ALTER TABLE samples ADD COLUMN IF NOT EXISTS version integer NOT NULL DEFAULT 1",
+]
+
+
+def backfill_sample_ids():
+    """
+    Encode the IDs of samples still holding a JSON list that can be encoded, those written before
+    the compact columns existed or while the JSON list was kept alongside them. Returns the number encoded.
+    """
+    encoded = 0
+    for sample in Sample.query.filter(Sample.ids.isnot(None)).all():
+        if sample.ids and encode_ids(sample.ids)[1] is not None:
+            sample.set_ids(sample.ids)
+            encoded += 1
+    return encoded
+
+
+def migrate(dry_run=False):
+    """Create missing tables, then apply every statement in MIGRATIONS."""
+    with app.app_context():
+        if not dry_run:
+            db.create_all()
+        for statement in MIGRATIONS:
+            print(statement)
+            if not dry_run:
+                db.session.execute(text(statement))
+        if not dry_run:
+            db.session.commit()
+            print(f"\nApplied {len(MIGRATIONS)} migrations")
+            encoded = backfill_sample_ids()
+            db.session.commit()
+            print(f"Encoded the IDs of {encoded} samples")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Apply schema migrations to the database.")
+    parser.add_argument('--dry-run', action='store_true', help="Print the statements without running them.")
+    args = parser.parse_args()
+
+    migrate(dry_run=args.dry_run)
@@ -1,20 +1,81 @@
+import re
+
 from app import db
-from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy import func, literal
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
+
+# OpenAlex IDs like "W6935303939": an alphabetic entity prefix and a numeric part without leading zeros
+COMPACT_ID_PATTERN = re.compile(r"([A-Za-z]+)([1-9][0-9]{0,17})")
+
+
+def encode_ids(ids):
+    """
+    Split a list of IDs sharing one prefix into (prefix, [numbers]) for compact bigint[] storage.
+    Returns (None, None) when any ID doesn't fit, e.g. "work-types/article", so callers keep the JSON list.
+    IDs that fit never contain a comma.
+    """
+    prefix = None
+    nums = []
+    for id in ids:
+        match = COMPACT_ID_PATTERN.fullmatch(id) if isinstance(id, str) else None
+        if not match or (prefix is not None and match.group(1) != prefix):
+            return None, None
+        prefix = match.group(1)
+        nums.append(int(match.group(2)))
+    if prefix is None:
+        return None, None
+    return prefix, nums
+
+
+def ids_from_columns(id_list, ids):
+    """Sample IDs from a row selected with Sample.ids_columns(): the comma-separated id_list, or the JSON list."""
+    return id_list.split(",") if id_list is not None else ids
 
 
 class Sample(db.Model):
     __tablename__ = 'samples'
+    __table_args__ = (
+        db.Index('ix_samples_entity_type_scope_date', 'entity', 'type', 'scope', 'date'),
+    )
     name = db.Column(db.Text, primary_key=True)
     entity = db.Column(db.Text)
     type = db.Column(db.Text)
     scope = db.Column(db.Text)
     description = db.Column(db.Text)
     date = db.Column(db.DateTime)
-    ids = db.Column(db.JSON)
+    # Only set for IDs that can't be encoded; the others are stored as id_prefix and id_nums alone
+    ids = db.Column(db.JSON(none_as_null=True))
+    # Compact form of the IDs (see encode_ids), NULL when they can't be encoded
+    id_prefix = db.Column(db.Text)
+    id_nums = db.Column(ARRAY(db.BigInteger))
+    # Bumped by every write of the IDs, so the per-worker cache in sample_cache.py notices samples
+    # reloaded under the same name and date
+    version = db.Column(db.Integer, nullable=False, server_default="1")
+
+    def set_ids(self, ids):
+        self.id_prefix, self.id_nums = encode_ids(ids)
+        self.ids = ids if self.id_nums is None else None
+        # Incremented in the UPDATE itself, so concurrent writers can't both set the same version
+        self.version = 1 if self.version is None else Sample.version + 1
+
+    @classmethod
+    def ids_columns(cls):
+        """
+        Columns for loading IDs: id_list, the IDs of compact samples rebuilt by Postgres as one
+        comma-separated string, which is much cheaper to split than having the driver parse a
+        bigint[] element by element, and the JSON list of the others.
+        """
+        return (
+            (cls.id_prefix + func.array_to_string(cls.id_nums, literal(",") + cls.id_prefix)).label("id_list"),
+            cls.ids,
+        )
 
 
 class MetricSet(db.Model):
     __tablename__ = 'metric_sets'
+    __table_args__ = (
+        db.Index('ix_metric_sets_type_scope_date', 'type', 'scope', 'date'),
+    )
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     type = db.Column(db.Text)
     entity = db.Column(db.Text)
@@ -37,10 +98,15 @@ class Response(db.Model):
     __tablename__ = 'responses'
     id = db.Column(db.Text, primary_key=True)
     entity = db.Column(db.Text)
-    date = db.Column(db.DateTime)
+    date = db.Column(db.DateTime, index=True)
     prod = db.Column(JSONB)
     walden = db.Column(JSONB)
     match = db.Column(JSONB)
+    # Content digest of prod, walden and match, lets save_data skip rewriting unchanged rows
+    digest = db.Column(db.Text)
+    # Set instead of prod / walden when the documents live in the documents table
+    prod_hash = db.Column(db.Text, index=True)
+    walden_hash = db.Column(db.Text, index=True)
     
     def to_dict(self):
         return {
@@ -51,4 +117,10 @@ class Response(db.Model):
             "walden": self.walden,
             "match": self.match
         }
-        
\ No newline at end of file
+
+
+class Document(db.Model):
+    __tablename__ = 'documents'
+    hash = db.Column(db.Text, primary_key=True)
+    doc = db.Column(JSONB)
+    zdoc = db.Column(db.LargeBinary)
@@ -0,0 +1,167 @@
+"""
+Profiling for run_metrics and the API.
+
+`run_metrics.py --profile [PATH]` runs the whole run under cProfile and tracemalloc. The pstats
+file goes to PATH (default run_metrics.pstats), the top allocation sites to PATH.memory.txt, and
+a summary of both to stdout. tracemalloc slows the run several times over, so compare the phase
+timings of profiled runs with each other only.
+
+    python run_metrics.py --test --profile
+    python -m pstats run_metrics.pstats    # then e.g. `sort cumtime`, `stats 30`
+
+Setting REQUEST_PROFILE_EVERY=N profiles one in N API requests, per worker, including the
+streaming of their bodies, and writes one pstats file per request to REQUEST_PROFILE_DIR
+(default /tmp/metrics-api-profiles), named after the time, route and duration.
+"""
+
+import itertools
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+TOP_FUNCTIONS = 30
+TOP_ALLOCATIONS = 25
+# Enough frames to get from an allocation in a library back to the code calling it
+TRACEMALLOC_FRAMES = 25
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+REQUEST_PROFILE_EVERY = int(os.getenv("REQUEST_PROFILE_EVERY", 0))
+REQUEST_PROFILE_DIR = os.getenv("REQUEST_PROFILE_DIR", "/tmp/metrics-api-profiles")
+
+
+def top_allocations(snapshot, limit=TOP_ALLOCATIONS):
+    """
+    Lines describing the allocation sites holding the most memory in a tracemalloc snapshot. Each
+    site is the line that allocated, plus the innermost line of this repository that led to it, so
+    memory allocated inside json or aiohttp is attributed to the code that called them.
+    """
+    sites = defaultdict(lambda: [0, 0])
+    for stat in snapshot.statistics("traceback"):
+        frames = list(stat.traceback)
+        caller = next((frame for frame in reversed(frames) if frame.filename.startswith(REPO_DIR) and frame.filename != __file__), None)
+        site = sites[(frames[-1], caller)]
+        site[0] += stat.size
+        site[1] += stat.count
+
+    ranked = sorted(sites.items(), key=lambda item: item[1][0], reverse=True)
+    lines = []
+    for (frame, caller), (size, count) in ranked[:limit]:
+        via = f"  (from {os.path.relpath(caller.filename, REPO_DIR)}:{caller.lineno})" if caller and caller != frame else ""
+        lines.append(f"{size / 1024 / 1024:10.1f} MB {count:10d} blocks  {frame.filename}:{frame.lineno}{via}")
+    rest = sum(size for _, (size, _) in ranked[limit:])
+    lines.append(f"{rest / 1024 / 1024:10.1f} MB in {max(len(ranked) - limit, 0)} other sites")
+    return lines
+
+
+@contextmanager
+def profile_run(path):
+    """Profile the enclosed block with cProfile and tracemalloc, writing path and path.memory.txt."""
+    # Imported here and in RequestProfiler so API workers that don't profile never load them
+    import cProfile
+    import io
+    import pstats
+    import tracemalloc
+
+    tracemalloc.start(TRACEMALLOC_FRAMES)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        # Taken before anything below allocates, so the sites are those of the run itself
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        profiler.dump_stats(path)
+        allocations = top_allocations(snapshot)
+        with open(f"{path}.memory.txt", "w") as f:
+            f.write(f"Peak traced memory: {peak / 1024 / 1024:.1f} MB\n")
+            f.write("\n".join(allocations) + "\n")
+
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+        print(out.getvalue())
+        print(f"Peak traced memory {peak / 1024 / 1024:.1f} MB; top allocation sites still held at the end:")
+        print("\n".join(allocations))
+        print(f"Wrote {path} and {path}.memory.txt")
+
+
+class ProfiledBody:
+    """Profiles the iteration of a WSGI response body, then writes the request's profile on close."""
+
+    def __init__(self, body, profiler, on_close):
+        self.body = body
+        self.profiler = profiler
+        self.on_close = on_close
+
+    def __iter__(self):
+        iterator = iter(self.body)
+        while True:
+            self.profiler.enable()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.profiler.disable()
+            yield chunk
+
+    def close(self):
+        try:
+            if hasattr(self.body, "close"):
+                self.body.close()
+        finally:
+            self.on_close()
+
+
+class RequestProfiler:
+    """WSGI middleware profiling every nth request. Requests arriving while one is profiled are skipped."""
+
+    def __init__(self, wsgi_app, every, directory):
+        self.wsgi_app = wsgi_app
+        self.every = every
+        self.directory = directory
+        self.counter = itertools.count(1)
+        # cProfile follows one thread, and only one profiler can be active at a time
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def __call__(self, environ, start_response):
+        if next(self.counter) % self.every or not self.lock.acquire(blocking=False):
+            return self.wsgi_app(environ, start_response)
+
+        import cProfile
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+
+        def finish():
+            try:
+                self.write(profiler, environ, time.perf_counter() - start)
+            finally:
+                self.lock.release()
+
+        profiler.enable()
+        try:
+            body = self.wsgi_app(environ, start_response)
+        except Exception:
+            profiler.disable()
+            finish()
+            raise
+        profiler.disable()
+        return ProfiledBody(body, profiler, finish)
+
+    def write(self, profiler, environ, seconds):
+        path = re.sub(r"[^A-Za-z0-9]+", "-", environ.get("PATH_INFO", "")).strip("-") or "root"
+        name = f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{environ.get('REQUEST_METHOD', '')}-{path[:80]}-{seconds * 1000:.0f}ms.pstats"
+        profiler.dump_stats(os.path.join(self.directory, name))
+
+
+def install_request_profiler(app):
+    """Wrap app.wsgi_app in a RequestProfiler when REQUEST_PROFILE_EVERY is set."""
+    if REQUEST_PROFILE_EVERY > 0:
+        app.wsgi_app = RequestProfiler(app.wsgi_app, REQUEST_PROFILE_EVERY, REQUEST_PROFILE_DIR)
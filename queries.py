@@ -0,0 +1,131 @@
+"""
+SQL building blocks shared by the /responses endpoints.
+Everything user-supplied (test keys, JSON paths) is passed as a bound parameter, never formatted into SQL.
+"""
+
+from documents import decompress_document, document_path
+
+RESPONSE_COLUMNS = ["id", "entity", "date", "prod", "walden", "match"]
+JSON_COLUMNS = ["prod", "walden", "match"]
+DOCUMENT_SIDES = ["prod", "walden"]
+# Every column, in response order, when no projection was requested
+DEFAULT_FIELDS = [(column, []) for column in RESPONSE_COLUMNS if column != "id"]
+
+
+def parse_fields(fields_param):
+    """
+    Parse a fields= parameter like "match,prod.title,walden.primary_location" into
+    (column, path) pairs, where path is a list of keys into a JSONB column ([] for the whole column).
+    Returns None when no projection was requested.
+    """
+    if not fields_param:
+        return None
+
+    fields = []
+    for field in fields_param.split(","):
+        field = field.strip()
+        if not field:
+            continue
+        column, _, path = field.partition(".")
+        if column not in RESPONSE_COLUMNS:
+            raise ValueError(f"Unknown field '{column}', expected one of: {', '.join(RESPONSE_COLUMNS)}")
+        if path and column not in JSON_COLUMNS:
+            raise ValueError(f"Field '{column}' is not a JSON document and has no subfields")
+        fields.append((column, path.split(".") if path else []))
+    return fields or None
+
+
+def projection_sql(fields=None, alias="r"):
+    """
+    Build the SELECT list and document joins for a projection. Subfields are extracted inside
+    Postgres with the jsonb #> operator, so whole documents are never read out of TOAST or sent
+    over the wire. prod and walden are read from the documents table when the response only holds
+    a hash; compressed documents come back as <side>_zdoc and are handled by row_values().
+    The id column is always selected (as "id"); projected values come back as f0, f1, ...
+    Returns (select_list, joins, params).
+    """
+    fields = fields or DEFAULT_FIELDS
+    sides = [side for side in DOCUMENT_SIDES if any(column == side for column, _ in fields)]
+    documents = {side: f"COALESCE({side[0]}d.doc, {alias}.{side})" for side in sides}
+
+    expressions = [f"{alias}.id"]
+    params = {}
+    for i, (column, path) in enumerate(fields):
+        value = documents.get(column, f"{alias}.{column}")
+        if path:
+            expressions.append(f"{value} #> :field_path_{i} AS f{i}")
+            params[f"field_path_{i}"] = path
+        else:
+            expressions.append(f"{value} AS f{i}")
+
+    joins = []
+    for side in sides:
+        expressions.append(f"{side[0]}d.zdoc AS {side}_zdoc")
+        joins.append(f"LEFT JOIN documents {side[0]}d ON {side[0]}d.hash = {alias}.{side}_hash")
+    return ", ".join(expressions), " ".join(joins), params
+
+
+def sample_ids_sql(sample, alias="s"):
+    """
+    FROM item yielding (id, position) for every ID of a cached sample. Compact samples, whose IDs
+    never contain a comma, bind them as one comma-separated string, much cheaper to send and parse
+    than a text[] literal of 10k elements; others bind the text IDs as an array. Returns (from_item, params).
+    """
+    if sample.id_list is not None:
+        return f"unnest(string_to_array(CAST(:sample_id_list AS text), ',')) WITH ORDINALITY AS {alias}(id, position)", {'sample_id_list': sample.id_list}
+    return f"unnest(CAST(:sample_ids AS text[])) WITH ORDINALITY AS {alias}(id, position)", {'sample_ids': sample.ids}
+
+
+def filter_sql(filter_test, alias="r"):
+    """Build an AND-ed WHERE fragment requiring every test key in filter_test to be true."""
+    conditions = []
+    params = {}
+    for i, test_key in enumerate(filter_test):
+        conditions.append(f"({alias}.match ->> :filter_test_{i})::boolean = true")
+        params[f"filter_test_{i}"] = test_key
+    return " AND ".join(conditions), params
+
+
+def field_names(fields=None):
+    """Flat column names for a projection, e.g. ["id", "match", "prod.title"], as used for CSV headers."""
+    fields = fields or DEFAULT_FIELDS
+    return ["id"] + [".".join([column] + path) for column, path in fields]
+
+
+def row_values(row, fields=None):
+    """Values of a row selected with projection_sql(), in field_names() order, rehydrating compressed documents."""
+    fields = fields or DEFAULT_FIELDS
+    documents = {}
+    for side in DOCUMENT_SIDES:
+        zdoc = row._mapping.get(f"{side}_zdoc")
+        if zdoc is not None:
+            documents[side] = decompress_document(zdoc)
+
+    values = [row.id]
+    for i, (column, path) in enumerate(fields):
+        if column in documents:
+            values.append(document_path(documents[column], path))
+        else:
+            values.append(row[i + 1])
+    return values
+
+
+def row_to_dict(row, fields=None):
+    """Turn a row selected with projection_sql() back into a (possibly nested) response dict."""
+    fields = fields or DEFAULT_FIELDS
+    values = row_values(row, fields)
+
+    result = {"id": values[0]}
+    for (column, path), value in zip(fields, values[1:]):
+        if not path:
+            result[column] = value
+            continue
+        target = result.setdefault(column, {})
+        for key in path[:-1]:
+            if not isinstance(target, dict):
+                break
+            target = target.setdefault(key, {})
+        # A non-dict target means a broader field that already contains this one was requested
+        if isinstance(target, dict):
+            target[path[-1]] = value
+    return result
@@ -0,0 +1,113 @@
+"""
+Optional routing of the read-only API to a streaming replica set in DATABASE_REPLICA_URL, so the
+save_data upserts on the primary don't slow the API down during metric runs.
+
+Read endpoints switch their session to the replica with use_replica(). The switch holds for the
+rest of the session, which Flask-SQLAlchemy removes at the end of each request, and is skipped
+(the session stays on the primary) when the replica is unreachable or further behind than
+REPLICA_MAX_LAG_SECONDS. When the replica fails between lag checks, read_only retries the
+request once on the primary and keeps later requests off the replica until the next check.
+"""
+
+import logging
+import os
+import time
+from functools import wraps
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+
+from app import app, db
+
+logger = logging.getLogger("metrics-api")
+
+REPLICA_MAX_LAG_SECONDS = float(os.getenv('REPLICA_MAX_LAG_SECONDS', 30))
+REPLICA_LAG_CHECK_SECONDS = float(os.getenv('REPLICA_LAG_CHECK_SECONDS', 5))
+
+# Per-worker cache of the last lag check: {"checked_at": monotonic time, "healthy": bool}
+lag_check = {}
+
+# Lag is 0 when everything received has been replayed; replay timestamps stop advancing while
+# the primary is idle, so they only measure lag while there is WAL left to apply.
+LAG_SQL = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+
+def replica_engine():
+    if 'replica' not in (app.config.get('SQLALCHEMY_BINDS') or {}):
+        return None
+    return db.get_engine(app, bind='replica')
+
+
+def replica_lag(engine):
+    """Replication lag of the replica in seconds."""
+    with engine.connect() as connection:
+        return float(connection.execute(LAG_SQL).scalar())
+
+
+def replica_healthy(engine):
+    """Whether the replica is reachable and within REPLICA_MAX_LAG_SECONDS, checked at most every REPLICA_LAG_CHECK_SECONDS."""
+    now = time.monotonic()
+    if lag_check and now - lag_check["checked_at"] < REPLICA_LAG_CHECK_SECONDS:
+        return lag_check["healthy"]
+
+    try:
+        lag = replica_lag(engine)
+        healthy = lag <= REPLICA_MAX_LAG_SECONDS
+        if not healthy:
+            logger.warning(f"Replica is {lag:.1f}s behind, reading from the primary")
+    except SQLAlchemyError as e:
+        healthy = False
+        logger.warning(f"Replica lag check failed, reading from the primary: {e}")
+    lag_check.update(checked_at=now, healthy=healthy)
+    return healthy
+
+
+def mark_replica_unhealthy():
+    """Keep sessions on the primary until the next lag check is due."""
+    lag_check.update(checked_at=time.monotonic(), healthy=False)
+
+
+def use_replica(session=None):
+    """
+    Send the rest of this session's queries to the replica, if one is configured and healthy.
+    Returns whether the session was switched.
+    """
+    session = session or db.session()
+    engine = replica_engine()
+    if engine is None or not replica_healthy(engine):
+        return False
+    session.info["bind"] = engine
+    return True
+
+
+def use_primary(session=None):
+    """Send the rest of this session's queries back to the primary."""
+    session = session or db.session()
+    session.info.pop("bind", None)
+
+
+def read_only(view):
+    """
+    Decorator for read-only endpoints, which may be served from the replica. A view failing on
+    the replica with an OperationalError (connection refused or lost) is run again on the
+    primary. Bodies streamed after the view returns are not retried.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not use_replica():
+            return view(*args, **kwargs)
+        try:
+            return view(*args, **kwargs)
+        except OperationalError as e:
+            logger.warning(f"Replica query failed, retrying on the primary: {e}")
+            db.session.rollback()
+            use_primary()
+            mark_replica_unhealthy()
+            return view(*args, **kwargs)
+    return wrapper
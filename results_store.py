@@ -0,0 +1,191 @@
+"""
+Disk-backed stores for prod_results and walden_results, for runs whose documents don't fit in memory.
+
+`run_metrics.py --memory-budget MB` swaps the in-memory dicts for two views of one ResultsStore:
+every document is written zstd-compressed to a temporary SQLite file as it is fetched, and an
+LRU cache of parsed documents, sized to the budget, sits in front of it. Both views keep the
+interface metrics.py uses, results[entity][id] with get, `in`, assignment and KeyError for IDs
+never stored, and a stored None (an ID the API didn't return) stays None.
+
+The budget covers the cached documents only, estimated from their JSON size, not the process:
+samples, matches and the rows built by save_data come on top.
+"""
+
+import json
+import os
+import sqlite3
+import tempfile
+import weakref
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+# Parsed JSON documents take about 4-5x their compact JSON size in Python objects
+MEMORY_PER_JSON_BYTE = 5
+NONE_ENTRY_BYTES = 100
+WRITE_BATCH_SIZE = 1000
+COMPRESSION_LEVEL = 3
+
+
+class ResultsStore:
+    def __init__(self, memory_budget_mb, directory=None):
+        import zstandard
+        self.compressor = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL)
+        self.decompressor = zstandard.ZstdDecompressor()
+
+        fd, self.path = tempfile.mkstemp(prefix="metrics-results-", suffix=".sqlite", dir=directory)
+        os.close(fd)
+        # Removed by close(), or at exit if a run fails before closing it
+        self.remove_file = weakref.finalize(self, os.remove, self.path)
+        self.connection = sqlite3.connect(self.path)
+        # A scratch file for one run: nothing to recover after a crash
+        self.connection.execute("PRAGMA journal_mode = OFF")
+        self.connection.execute("PRAGMA synchronous = OFF")
+        self.connection.execute(
+            "CREATE TABLE results (side TEXT, entity TEXT, id TEXT, doc BLOB, PRIMARY KEY (side, entity, id)) WITHOUT ROWID"
+        )
+
+        self.budget = memory_budget_mb * 1024 * 1024
+        self.cache = OrderedDict()  # (side, entity, id) -> (doc, estimated bytes)
+        self.cached_bytes = 0
+        self.pending = []
+        self.hits = 0
+        self.misses = 0
+
+    def side(self, side):
+        return SideResults(self, side)
+
+    def put(self, key, doc):
+        if doc is None:
+            blob, size = None, NONE_ENTRY_BYTES
+        else:
+            data = json.dumps(doc, separators=(",", ":")).encode("utf-8")
+            blob, size = self.compressor.compress(data), len(data) * MEMORY_PER_JSON_BYTE
+        self.pending.append((*key, blob))
+        if len(self.pending) >= WRITE_BATCH_SIZE:
+            self.flush()
+        self.cache_put(key, doc, size)
+
+    def get(self, key):
+        """The document stored under key; raises KeyError when nothing was stored."""
+        entry = self.cache.get(key)
+        if entry is not None:
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+        self.flush()
+        row = self.connection.execute("SELECT doc FROM results WHERE side = ? AND entity = ? AND id = ?", key).fetchone()
+        if row is None:
+            raise KeyError(key[2])
+        if row[0] is None:
+            doc, size = None, NONE_ENTRY_BYTES
+        else:
+            data = self.decompressor.decompress(row[0])
+            doc, size = json.loads(data), len(data) * MEMORY_PER_JSON_BYTE
+        self.cache_put(key, doc, size)
+        return doc
+
+    def contains(self, key):
+        if key in self.cache:
+            return True
+        self.flush()
+        return self.connection.execute("SELECT 1 FROM results WHERE side = ? AND entity = ? AND id = ?", key).fetchone() is not None
+
+    def delete(self, key):
+        self.flush()
+        entry = self.cache.pop(key, None)
+        if entry is not None:
+            self.cached_bytes -= entry[1]
+        deleted = self.connection.execute("DELETE FROM results WHERE side = ? AND entity = ? AND id = ?", key).rowcount
+        if not deleted and entry is None:
+            raise KeyError(key[2])
+
+    def ids(self, side, entity):
+        self.flush()
+        return [id for id, in self.connection.execute("SELECT id FROM results WHERE side = ? AND entity = ? ORDER BY id", (side, entity))]
+
+    def count(self, side, entity):
+        self.flush()
+        return self.connection.execute("SELECT count(*) FROM results WHERE side = ? AND entity = ?", (side, entity)).fetchone()[0]
+
+    def entities(self, side):
+        self.flush()
+        return [entity for entity, in self.connection.execute("SELECT DISTINCT entity FROM results WHERE side = ?", (side,))]
+
+    def cache_put(self, key, doc, size):
+        old = self.cache.pop(key, None)
+        if old is not None:
+            self.cached_bytes -= old[1]
+        self.cache[key] = (doc, size)
+        self.cached_bytes += size
+        while self.cached_bytes > self.budget and len(self.cache) > 1:
+            _, (_, evicted_size) = self.cache.popitem(last=False)
+            self.cached_bytes -= evicted_size
+
+    def flush(self):
+        if self.pending:
+            with self.connection:
+                self.connection.executemany("INSERT OR REPLACE INTO results (side, entity, id, doc) VALUES (?, ?, ?, ?)", self.pending)
+            self.pending = []
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "memory_budget_mb": round(self.budget / 1024 / 1024, 1),
+            "cached_documents": len(self.cache),
+            "cached_mb": round(self.cached_bytes / 1024 / 1024, 1),
+            "file_mb": round(os.path.getsize(self.path) / 1024 / 1024, 1),
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+        }
+
+    def close(self):
+        self.connection.close()
+        self.cache.clear()
+        self.cached_bytes = 0
+        self.remove_file()
+
+
+class SideResults:
+    """results[entity] for one side of a ResultsStore, like the defaultdict(dict) it replaces."""
+
+    def __init__(self, store, side):
+        self.store = store
+        self.side = side
+
+    def __getitem__(self, entity):
+        return EntityResults(self.store, self.side, entity)
+
+    def __contains__(self, entity):
+        return entity in self.store.entities(self.side)
+
+    def keys(self):
+        return self.store.entities(self.side)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+
+class EntityResults(MutableMapping):
+    def __init__(self, store, side, entity):
+        self.store = store
+        self.side = side
+        self.entity = entity
+
+    def __getitem__(self, id):
+        return self.store.get((self.side, self.entity, id))
+
+    def __setitem__(self, id, doc):
+        self.store.put((self.side, self.entity, id), doc)
+
+    def __delitem__(self, id):
+        self.store.delete((self.side, self.entity, id))
+
+    def __contains__(self, id):
+        return self.store.contains((self.side, self.entity, id))
+
+    def __iter__(self):
+        return iter(self.store.ids(self.side, self.entity))
+
+    def __len__(self):
+        return self.store.count(self.side, self.entity)
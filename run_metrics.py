@@ -4,12 +4,26 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from metrics import run_metrics
+from profiling import profile_run
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Run OpenAlex metrics comparison')
-    parser.add_argument('--scope', default="all", choices=["all", "last-week"], help="Which sample scope to run against")
+    parser.add_argument('--scope', default="all", choices=["all", "last-week", "synthetic"], help="Which sample scope to run against; synthetic is that of samples saved by benchmarks/synthetic_corpus.py")
     parser.add_argument('--test', action='store_true', help='Run in test mode (skip saving to database)')
+    parser.add_argument('--loader', default="insert", choices=["insert", "copy"], help="How to upsert responses: chunked INSERTs or COPY into a staging table")
+    parser.add_argument('--skip-unchanged', action='store_true', help="Leave responses whose content digest is unchanged untouched; their date then stays that of the run that last changed them")
+    parser.add_argument('--document-store', choices=["json", "zstd"], help="Store prod/walden documents once in the documents table, as JSONB or zstd-compressed JSON")
+    parser.add_argument('--history-months', type=int, help="Record changed responses in response_history and keep this many months of partitions; implies --skip-unchanged")
+    parser.add_argument('--report-file', help="Also write the per-phase timing report as JSON to this file")
+    parser.add_argument('--memory-budget', type=int, metavar="MB", help="Keep fetched documents in a temporary on-disk store, caching at most this many MB of them in memory")
+    parser.add_argument('--profile', nargs='?', const="run_metrics.pstats", metavar="PATH", help="Profile the run with cProfile and tracemalloc, writing PATH (default run_metrics.pstats) and PATH.memory.txt")
+    parser.add_argument('--corpus', help="Read prod/walden pairs from a corpus written by benchmarks/synthetic_corpus.py instead of the samples and the API; implies --test")
     
     args = parser.parse_args()
     
-    asyncio.run(run_metrics(test=args.test, scope=args.scope))
\ No newline at end of file
+    run = run_metrics(test=args.test, scope=args.scope, loader=args.loader, skip_unchanged=args.skip_unchanged, document_store=args.document_store, history_months=args.history_months, report_file=args.report_file, corpus=args.corpus, memory_budget=args.memory_budget)
+    if args.profile:
+        with profile_run(args.profile):
+            asyncio.run(run)
+    else:
+        asyncio.run(run)
\ No newline at end of file
@@ -0,0 +1,113 @@
+"""
+Per-phase timing report for run_metrics.
+
+Each phase records wall time, CPU time, the process's RSS high-water mark when it started and
+when it ended, and, where the phase handles documents, the documents processed per second and
+the bytes fetched. The high-water mark covers the whole process lifetime, so it only says a phase
+used more memory than any phase before it when the end value is above the start value. Fetching runs
+all entities and sides concurrently, so fetch_by_entity reports each entity/side's span from its
+first request to its last response rather than CPU time.
+"""
+
+import json
+import resource
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+def rss_high_water_mb():
+    """The highest RSS the process has reached so far, not its current RSS."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def docs_per_second(docs, seconds):
+    return round(docs / seconds, 1) if docs and seconds > 0 else None
+
+
+class Phase:
+    def __init__(self):
+        self.docs = 0
+        self.bytes = 0
+
+
+class FetchSpan:
+    def __init__(self):
+        self.started = None
+        self.finished = None
+        self.requests = 0
+        self.docs = 0
+        self.bytes = 0
+
+
+class RunReport:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.fetch_spans = defaultdict(FetchSpan)
+        self.sections = {}
+
+    @contextmanager
+    def phase(self, name):
+        """Time the enclosed block as the named phase. Callers add to .docs and .bytes of the yielded Phase."""
+        phase = Phase()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        rss_high_water_start = rss_high_water_mb()
+        try:
+            yield phase
+        finally:
+            wall = time.perf_counter() - wall_start
+            self.phases[name] = {
+                "wall_seconds": round(wall, 3),
+                "cpu_seconds": round(time.process_time() - cpu_start, 3),
+                "rss_high_water_start_mb": rss_high_water_start,
+                "rss_high_water_end_mb": rss_high_water_mb(),
+                "docs": phase.docs,
+                "docs_per_second": docs_per_second(phase.docs, wall),
+                "bytes": phase.bytes,
+            }
+
+    def record_fetch(self, entity, side, started, docs, bytes_):
+        """Record one successful request for entity/side, started at the given perf_counter time."""
+        span = self.fetch_spans[(entity, side)]
+        span.started = started if span.started is None else min(span.started, started)
+        span.finished = time.perf_counter()
+        span.requests += 1
+        span.docs += docs
+        span.bytes += bytes_
+
+    def add_section(self, name, data):
+        """Include data from elsewhere in the run, such as the fetch telemetry summary, in the report."""
+        self.sections[name] = data
+
+    def fetched_docs(self):
+        return sum(span.docs for span in self.fetch_spans.values())
+
+    def fetched_bytes(self):
+        return sum(span.bytes for span in self.fetch_spans.values())
+
+    def to_dict(self):
+        fetch_by_entity = defaultdict(dict)
+        for (entity, side), span in sorted(self.fetch_spans.items()):
+            wall = span.finished - span.started
+            fetch_by_entity[entity][side] = {
+                "wall_seconds": round(wall, 3),
+                "requests": span.requests,
+                "docs": span.docs,
+                "docs_per_second": docs_per_second(span.docs, wall),
+                "bytes": span.bytes,
+            }
+        return {
+            "total_wall_seconds": round(time.perf_counter() - self.started, 3),
+            "rss_high_water_mb": rss_high_water_mb(),
+            "phases": self.phases,
+            "fetch_by_entity": dict(fetch_by_entity),
+            **self.sections,
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
@@ -0,0 +1,48 @@
+from app import db
+from api_metrics import record_cache
+from models import Sample, ids_from_columns
+
+# Per-worker cache of the latest sample for each (entity, type, scope).
+# Plain dict reads and writes are atomic, so concurrent requests at worst load the same sample twice.
+latest_samples = {}
+
+
+class CachedSample:
+    def __init__(self, name, date, ids, id_list=None, version=None):
+        self.name = name
+        self.date = date
+        self.version = version
+        self.ids = ids
+        self.positions = {id: i for i, id in enumerate(ids)}
+        # The IDs as one comma-separated string for compact samples, bound instead of the array of
+        # strings in whole-sample queries when available
+        self.id_list = id_list
+
+
+def get_latest_sample(entity, type_="both", scope="all"):
+    """
+    Return the latest sample for (entity, type_, scope) with its decoded IDs and a position map.
+    Each call runs a cheap probe for the latest (name, date, version), without the ids column, and
+    only reloads the ID list when another sample is the latest or its IDs were rewritten since:
+    load_samples.py keeps the date from samples.json, but every write of the IDs bumps the version.
+    """
+    latest = (
+        db.session.query(Sample.name, Sample.date, Sample.version)
+        .filter_by(entity=entity, type=type_, scope=scope)
+        .order_by(Sample.date.desc())
+        .first()
+    )
+    if latest is None:
+        return None
+
+    key = (entity, type_, scope)
+    cached = latest_samples.get(key)
+    if cached is not None and (cached.name, cached.date, cached.version) == tuple(latest):
+        record_cache("sample", True)
+        return cached
+    record_cache("sample", False)
+
+    id_list, ids = db.session.query(*Sample.ids_columns()).filter_by(name=latest.name).one()
+    cached = CachedSample(latest.name, latest.date, ids_from_columns(id_list, ids) or [], id_list, latest.version)
+    latest_samples[key] = cached
+    return cached
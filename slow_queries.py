@@ -0,0 +1,122 @@
+"""
+Slow-query recording for the API.
+
+Statements taking longer than SLOW_QUERY_MS (default 1000, 0 turns recording off) are logged with
+their route, duration and the size of each bound parameter (items in a list, characters in a
+string), never the values, since the plan of the filtered /responses queries depends mostly on
+how large the sample is. The most recent SLOW_QUERY_BUFFER_SIZE of them are kept per worker.
+
+With SLOW_QUERY_EXPLAIN_RATE set (0 to 1), that share of slow SELECTs is run again under
+EXPLAIN (ANALYZE, BUFFERS) on the same connection and the plan is kept with the record. This
+doubles the cost of those queries, so keep the rate low in production. Set DEBUG_ENDPOINTS=True to
+serve the buffer at /debug/slow-queries; plans can contain parameter values, so it is off by default.
+"""
+
+import logging
+import os
+import random
+import time
+from collections import deque
+from datetime import datetime
+
+from flask import abort, has_request_context, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import app
+
+logger = logging.getLogger("metrics-api")
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 1000))
+SLOW_QUERY_EXPLAIN_RATE = float(os.getenv("SLOW_QUERY_EXPLAIN_RATE", 0))
+SLOW_QUERY_BUFFER_SIZE = int(os.getenv("SLOW_QUERY_BUFFER_SIZE", 100))
+DEBUG_ENDPOINTS = os.getenv("DEBUG_ENDPOINTS", False) == "True"
+
+START_KEY = "slow_queries.start"
+STATEMENT_PREVIEW_CHARS = 2000
+
+slow_queries = deque(maxlen=SLOW_QUERY_BUFFER_SIZE)
+
+
+def parameter_size(value):
+    if isinstance(value, (list, tuple)):
+        return {"type": "array", "items": len(value)}
+    if isinstance(value, (str, bytes)):
+        return {"type": type(value).__name__, "length": len(value)}
+    return {"type": type(value).__name__}
+
+
+def parameter_sizes(parameters, executemany):
+    """The type and size of each bound parameter, or the row count of an executemany."""
+    if executemany:
+        return {"rows": len(parameters)}
+    if isinstance(parameters, dict):
+        return {name: parameter_size(value) for name, value in parameters.items()}
+    return {str(i): parameter_size(value) for i, value in enumerate(parameters or ())}
+
+
+def explain(cursor, statement, parameters):
+    """EXPLAIN (ANALYZE, BUFFERS) output for a statement, run on the connection of its cursor."""
+    # A savepoint keeps a failed EXPLAIN from aborting the request's transaction
+    explain_cursor = cursor.connection.cursor()
+    try:
+        explain_cursor.execute("SAVEPOINT slow_query_explain")
+        try:
+            explain_cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters)
+            plan = "\n".join(row[0] for row in explain_cursor.fetchall())
+            explain_cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+            return plan
+        except Exception as e:
+            explain_cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+            return f"EXPLAIN failed: {e}"
+    finally:
+        explain_cursor.close()
+
+
+def should_explain(statement, executemany):
+    # ANALYZE executes the statement, so only ever explain reads
+    first_word = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return not executemany and first_word in ("SELECT", "WITH") and random.random() < SLOW_QUERY_EXPLAIN_RATE
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if SLOW_QUERY_MS:
+        conn.info[START_KEY] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info.pop(START_KEY, None)
+    if start is None:
+        return
+    duration_ms = (time.perf_counter() - start) * 1000
+    if duration_ms < SLOW_QUERY_MS:
+        return
+
+    route = request.url_rule.rule if has_request_context() and request.url_rule else None
+    sizes = parameter_sizes(parameters, executemany)
+    logger.warning(f"Slow query ({duration_ms:.0f}ms) on {route}: {' '.join(statement.split())[:500]} parameters: {sizes}")
+
+    record = {
+        "at": datetime.utcnow().isoformat(),
+        "route": route,
+        "duration_ms": round(duration_ms, 1),
+        "statement": statement[:STATEMENT_PREVIEW_CHARS],
+        "parameters": sizes,
+        "plan": None,
+    }
+    if should_explain(statement, executemany):
+        record["plan"] = explain(cursor, statement, parameters)
+    slow_queries.append(record)
+
+
+@app.route("/debug/slow-queries", methods=["GET"])
+def slow_queries_endpoint():
+    if not DEBUG_ENDPOINTS:
+        abort(404)
+    return jsonify({
+        "threshold_ms": SLOW_QUERY_MS,
+        "explain_rate": SLOW_QUERY_EXPLAIN_RATE,
+        "queries": list(reversed(slow_queries)),
+    })
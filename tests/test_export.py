@@ -0,0 +1,17 @@
+from werkzeug.http import parse_options_header
+
+from views import attachment_header
+
+
+def test_attachment_header_quotes_separators():
+    value, options = parse_options_header(attachment_header('works-My "sample"; v2.csv'))
+    assert value == "attachment"
+    assert options["filename"] == 'works-My "sample"; v2.csv'
+
+
+def test_attachment_header_encodes_non_ascii():
+    header = attachment_header("works-Échantillon ñ.ndjson")
+    header.encode("latin-1")
+    assert 'filename="works-Echantillon n.ndjson"' in header
+    assert "filename*=UTF-8''works-%C3%89chantillon%20%C3%B1.ndjson" in header
+    assert parse_options_header(header)[1]["filename"] == "works-Échantillon ñ.ndjson"
@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from history import HISTORY_TABLE, match_transitions, record_history
+from models import Response
+
+
+def save_responses(db, matches, date):
+    for id, match in matches.items():
+        db.session.merge(Response(id=id, entity="works", date=date, match=match, digest=str(match)))
+    db.session.commit()
+
+
+def history(db, id):
+    return db.session.execute(
+        text(f"SELECT run_date, match FROM {HISTORY_TABLE} WHERE id = :id ORDER BY run_date"), {"id": id}
+    ).all()
+
+
+def test_first_run_records_every_response(database):
+    first_run = datetime(2026, 9, 1, 12)
+    # Saved by earlier runs without history, then skipped as unchanged: their date isn't the run's
+    save_responses(database, {"W1": {"a": True}, "W2": {"a": True}}, first_run - timedelta(days=7))
+    save_responses(database, {"W3": {"a": False}}, first_run)
+
+    assert record_history(database.session, first_run) == 3
+
+    second_run = first_run + timedelta(days=1)
+    save_responses(database, {"W1": {"a": False}}, second_run)
+    assert record_history(database.session, second_run) == 1
+
+    assert [row.run_date for row in history(database, "W2")] == [first_run.date()]
+    assert match_transitions(history(database, "W1")) == [
+        {"run_date": "2026-09-01", "changes": {"a": {"from": None, "to": True}}},
+        {"run_date": "2026-09-02", "changes": {"a": {"from": True, "to": False}}},
+    ]
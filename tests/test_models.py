@@ -0,0 +1,24 @@
+import pytest
+
+from models import encode_ids
+
+
+def test_encode_ids_round_trips():
+    ids = ["W2741809807", "W1", "W999999999999999999"]
+    prefix, nums = encode_ids(ids)
+    assert (prefix, nums) == ("W", [2741809807, 1, 999999999999999999])
+    assert [f"{prefix}{num}" for num in nums] == ids
+
+
+@pytest.mark.parametrize("ids", [
+    ["W123\n"],
+    ["W1", "W123\n"],
+    ["\nW123"],
+    ["W0123"],
+    ["W1", "A2"],
+    ["work-types/article"],
+    ["W1234567890123456789"],
+    [],
+])
+def test_encode_ids_keeps_ids_that_dont_round_trip(ids):
+    assert encode_ids(ids) == (None, None)
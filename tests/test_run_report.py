@@ -0,0 +1,18 @@
+from run_report import RunReport, rss_high_water_mb
+
+
+def test_phases_report_the_high_water_mark_at_start_and_end():
+    report = RunReport()
+    with report.phase("small"):
+        pass
+    with report.phase("large"):
+        # Touching more than the high-water mark so far raises it whatever the current RSS is
+        block = bytearray(int((rss_high_water_mb() + 64) * 1024 * 1024))
+        block[::4096] = b"x" * len(block[::4096])
+        del block
+
+    report = report.to_dict()
+    small, large = report["phases"]["small"], report["phases"]["large"]
+    assert small["rss_high_water_end_mb"] <= large["rss_high_water_start_mb"]
+    assert large["rss_high_water_end_mb"] - large["rss_high_water_start_mb"] >= 32
+    assert report["rss_high_water_mb"] >= large["rss_high_water_end_mb"]
@@ -0,0 +1,39 @@
+import pytest
+from sqlalchemy import text
+
+import metrics
+from documents import decompress_document
+from models import Document, Response
+
+
+@pytest.fixture
+def run(monkeypatch):
+    """Results of a run over five works, saved two at a time."""
+    ids = [f"W{i}" for i in range(1, 6)]
+    monkeypatch.setattr(metrics, "SAVE_CHUNK_SIZE", 2)
+    monkeypatch.setattr(metrics, "samples", {entity: {} for entity in metrics.entities})
+    metrics.samples["works"]["both"] = {"ids": ids}
+    monkeypatch.setattr(metrics, "prod_results", {"works": {id: {"id": id, "title": "prod"} for id in ids}})
+    monkeypatch.setattr(metrics, "walden_results", {"works": {id: {"id": id, "title": "walden"} for id in ids}})
+    monkeypatch.setattr(metrics, "matches", {"works": {id: {"title": False} for id in ids}})
+    monkeypatch.setattr(metrics, "coverage", {})
+    monkeypatch.setattr(metrics, "match_rates", {})
+    return ids
+
+
+@pytest.mark.parametrize("loader", ["insert", "copy"])
+def test_save_data_writes_every_chunk(database, run, loader, capsys):
+    database.session.execute(text("TRUNCATE documents"))
+    database.session.commit()
+
+    metrics.save_data(loader=loader, document_store="zstd")
+    assert "Responses written: 5, skipped (unchanged): 0" in capsys.readouterr().out
+    responses = {response.id: response for response in database.session.query(Response)}
+    assert sorted(responses) == run
+    walden = database.session.get(Document, responses["W5"].walden_hash)
+    assert decompress_document(walden.zdoc) == {"id": "W5", "title": "walden"}
+
+    metrics.walden_results["works"]["W4"] = {"id": "W4", "title": "prod"}
+    metrics.matches["works"]["W4"] = {"title": True}
+    metrics.save_data(loader=loader, document_store="zstd", skip_unchanged=True)
+    assert "Responses written: 1, skipped (unchanged): 4" in capsys.readouterr().out
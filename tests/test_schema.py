@@ -0,0 +1,28 @@
+import zlib
+
+import pytest
+
+from views import app
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+@pytest.mark.parametrize("encoding", ["identity", "gzip", "deflate"])
+def test_schema_revalidates_with_its_etag(client, encoding):
+    response = client.get("/schema", headers={"Accept-Encoding": encoding})
+    assert response.status_code == 200
+    assert response.headers.get("Content-Encoding", "identity") == encoding
+
+    etag = response.headers["ETag"]
+    for if_none_match in (etag, "W/" + etag):
+        revalidated = client.get("/schema", headers={"Accept-Encoding": encoding, "If-None-Match": if_none_match})
+        assert revalidated.status_code == 304
+
+
+def test_schema_deflate_body_is_the_schema(client):
+    identity = client.get("/schema", headers={"Accept-Encoding": "identity"}).get_data()
+    deflated = client.get("/schema", headers={"Accept-Encoding": "deflate"}).get_data()
+    assert zlib.decompress(deflated) == identity
@@ -1,15 +1,40 @@
+import csv
+import gzip
+import hashlib
+import io
+import json
 import logging
 import os
-from flask import jsonify, request
+import unicodedata
+import zlib
+from datetime import datetime, timedelta
+from urllib.parse import quote
+from flask import jsonify, request, make_response, stream_with_context
 from app import app, db
 from flask_cors import CORS
 
-from models import MetricSet, Response, Sample
-from schema import tests_schema
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+from werkzeug.http import dump_options_header
+
+from models import MetricSet
+from queries import parse_fields, projection_sql, sample_ids_sql, filter_sql, field_names, row_values, row_to_dict
+from history import HISTORY_TABLE, match_transitions
+from replica import read_only
+from api_metrics import record_cache
+from profiling import install_request_profiler
+import slow_queries  # registers the slow-query engine events and /debug/slow-queries
+from sample_cache import get_latest_sample
+from schema import tests_schema, get_test_keys
 
 logger = logging.getLogger("metrics-api")
 
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 500))
+HISTORY_INTERVALS = ["run", "day", "week", "month"]
+HISTORY_DEFAULT_DAYS = 90
+
 CORS(app)
+install_request_profiler(app)
 
 @app.route("/", methods=["GET"])
 def base_endpoint():
@@ -18,8 +43,15 @@ def base_endpoint():
     })
 
 
-@app.route("/schema", methods=["GET"])
-def schema_endpoint():
+SCHEMA_CACHE_MAX_AGE = int(os.getenv("SCHEMA_CACHE_MAX_AGE", 86400))
+
+
+def build_schema_payloads():
+    """
+    Serialize tests_schema once and pre-compress it for every encoding flask_compress offers, so
+    it never compresses /schema itself and rewrites the ETag to one revalidation can't match.
+    tests_schema is fixed at import time, so the /schema body never changes within a deploy.
+    """
     tests_schema_serializable = {
         entity: [
             {**test, "test_func": test.get("test_func").__name__, "key": test.get("display_name").replace(" ", "_").lower()}
@@ -27,30 +59,199 @@ def schema_endpoint():
         ]
         for entity, tests in tests_schema.items()
     }
-    return jsonify({"tests_schema": tests_schema_serializable})
+    body = json.dumps({"tests_schema": tests_schema_serializable}, separators=(",", ":"), sort_keys=True).encode("utf-8")
+    payloads = {
+        "identity": body,
+        "gzip": gzip.compress(body, compresslevel=9, mtime=0),
+        "deflate": zlib.compress(body, 9),
+    }
+    try:
+        import brotli
+        payloads["br"] = brotli.compress(body, quality=11)
+    except ImportError:
+        pass
+    return hashlib.sha1(body).hexdigest(), payloads
+
+
+schema_etag, schema_payloads = build_schema_payloads()
+# Smallest first, so clients accepting several encodings get the most compact one
+schema_encodings = sorted((e for e in schema_payloads if e != "identity"), key=lambda e: len(schema_payloads[e]))
+
+
+@app.route("/schema", methods=["GET"])
+def schema_endpoint():
+    encoding = request.accept_encodings.best_match(schema_encodings) or "identity"
+    etag = schema_etag if encoding == "identity" else f"{schema_etag}-{encoding}"
+
+    # If-None-Match uses the weak comparison, and proxies that re-encode bodies often weaken ETags to W/"..."
+    not_modified = request.if_none_match.contains_weak(etag)
+    record_cache("schema_etag", not_modified)
+    if not_modified:
+        response = make_response("", 304)
+    else:
+        response = make_response(schema_payloads[encoding])
+        response.mimetype = "application/json"
+        if encoding != "identity":
+            # Setting Content-Encoding also tells flask_compress to leave the body alone
+            response.headers["Content-Encoding"] = encoding
+
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = f"public, max-age={SCHEMA_CACHE_MAX_AGE}"
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+
+def latest_metric_set(type_, scope, entities=None):
+    """
+    Return the latest MetricSet of type_ as a dict. With entities, only those entities' slices of
+    the data blob are extracted (in Postgres, with ->) and returned, so small panels skip the rest.
+    """
+    if not entities:
+        metricset = MetricSet.query.filter_by(type=type_, scope=scope).order_by(MetricSet.date.desc()).first()
+        return metricset.to_dict() if metricset else None
+
+    pairs = []
+    params = {'type': type_, 'scope': scope}
+    for i, entity in enumerate(entities):
+        pairs.append(f":entity_{i}, data -> :entity_{i}")
+        params[f"entity_{i}"] = entity
+    sql = text(f"""
+        SELECT id, type, entity, scope, date, jsonb_build_object({', '.join(pairs)}) AS data
+        FROM metric_sets
+        WHERE type = :type
+        AND scope = :scope
+        ORDER BY date DESC
+        LIMIT 1
+    """)
+    row = db.session.execute(sql, params).first()
+    return dict(row._mapping) if row else None
+
+
+def metric_set_endpoint(type_):
+    scope = request.args.get("sample", "all")
+    entities = [entity for entity in request.args.get("entity", "").split(",") if entity]
+    metricset = latest_metric_set(type_, scope, entities)
+    if metricset is None:
+        return jsonify({"error": f"No {type_} metrics found for {scope}"}), 404
+    return jsonify(metricset)
 
 
 @app.route("/coverage", methods=["GET"])
+@read_only
 def coverage_endpoint():
     # return the latest metricset with type: "coverage"
-    scope = request.args.get("sample", "all")
-    metricset = MetricSet.query.filter_by(type="coverage", scope=scope).order_by(MetricSet.date.desc()).first()
-    return jsonify(metricset.to_dict())
+    return metric_set_endpoint("coverage")
 
 
 @app.route("/match-rates", methods=["GET"])
+@read_only
 def match_rates_endpoint():
     # return the latest metricset with type: "match_rates"
+    return metric_set_endpoint("match_rates")
+
+
+def fetch_responses(page_ids, positions, fields=None):
+    """Fetch the responses for page_ids, projected to fields, in sample order."""
+    select_list, joins, params = projection_sql(fields)
+    sql = text(f"""
+        SELECT {select_list}
+        FROM responses r
+        {joins}
+        WHERE r.id = ANY(:page_ids)
+    """)
+    rows = db.session.execute(sql, {**params, 'page_ids': page_ids}).all()
+    rows.sort(key=lambda row: positions[row.id])
+    return [row_to_dict(row, fields) for row in rows]
+
+
+def metric_set_history(type_):
+    """
+    Per-key values of one entity across MetricSet runs, downsampled to the last run in each
+    day/week/month bucket. Buckets are picked from the (type, scope, date) index first, and values are
+    extracted with JSONB path operators only for the picked rows, so full data blobs never leave Postgres.
+    """
     scope = request.args.get("sample", "all")
-    metricset = MetricSet.query.filter_by(type="match_rates", scope=scope).order_by(MetricSet.date.desc()).first()
-    return jsonify(metricset.to_dict())
+    entity = request.args.get("entity", "works")
+    interval = request.args.get("interval", "day")
+    keys = [key for key in request.args.get("keys", "").split(",") if key]
 
+    if interval not in HISTORY_INTERVALS:
+        return jsonify({"error": f"interval must be one of: {', '.join(HISTORY_INTERVALS)}"}), 400
+    try:
+        date_to = datetime.strptime(request.args["to"], "%Y-%m-%d") + timedelta(days=1) if "to" in request.args else datetime.now()
+        date_from = datetime.strptime(request.args["from"], "%Y-%m-%d") if "from" in request.args else date_to - timedelta(days=HISTORY_DEFAULT_DAYS)
+    except ValueError:
+        return jsonify({"error": "from and to must be dates formatted as YYYY-MM-DD"}), 400
 
-def get_latest_sample(entity, type_="both", scope="all"):
-    return db.session.query(Sample).filter_by(entity=entity, type=type_, scope=scope).order_by(Sample.date.desc()).first()
+    params = {
+        'type': type_,
+        'scope': scope,
+        'date_from': date_from,
+        'date_to': date_to,
+        'entity': entity,
+    }
+    if keys:
+        # Dotted keys reach further into the entity's values, e.g. "prod.coverage" on /coverage/history
+        pairs = []
+        for i, key in enumerate(keys):
+            pairs.append(f":key_{i}, m.data #> :key_path_{i}")
+            params[f"key_{i}"] = key
+            params[f"key_path_{i}"] = [entity] + key.split(".")
+        value_expr = f"jsonb_build_object({', '.join(pairs)})"
+    else:
+        value_expr = "m.data -> :entity"
+
+    if interval == "run":
+        bucket_expr = "date"
+    else:
+        bucket_expr = "date_trunc(:interval, date)"
+        params['interval'] = interval
+
+    sql = text(f"""
+        WITH picked AS (
+            SELECT DISTINCT ON ({bucket_expr}) id, {bucket_expr} AS bucket
+            FROM metric_sets
+            WHERE type = :type
+            AND scope = :scope
+            AND date >= :date_from
+            AND date < :date_to
+            ORDER BY {bucket_expr}, date DESC
+        )
+        SELECT p.bucket, m.date, {value_expr} AS value
+        FROM picked p
+        JOIN metric_sets m ON m.id = p.id
+        ORDER BY p.bucket
+    """)
+    rows = db.session.execute(sql, params).all()
+
+    return jsonify({
+        "meta": {
+            "type": type_,
+            "scope": scope,
+            "entity": entity,
+            "interval": interval,
+            "from": date_from,
+            "to": date_to,
+            "count": len(rows)
+        },
+        "results": [{"bucket": row.bucket, "date": row.date, "value": row.value} for row in rows]
+    })
+
+
+@app.route("/coverage/history", methods=["GET"])
+@read_only
+def coverage_history_endpoint():
+    return metric_set_history("coverage")
+
+
+@app.route("/match-rates/history", methods=["GET"])
+@read_only
+def match_rates_history_endpoint():
+    return metric_set_history("match_rates")
 
 
 @app.route("/responses/<entity>", methods=["GET"])
+@read_only
 def responses_endpoint(entity):
     page = int(request.args.get("page", 1))
     per_page = int(request.args.get("per_page", 100))
@@ -59,6 +260,10 @@ def responses_endpoint(entity):
     if filter_test:
         filter_test = filter_test.split(",")
 
+    try:
+        fields = parse_fields(request.args.get("fields", ""))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     sample = get_latest_sample(entity, scope=scope)
     
@@ -74,82 +279,39 @@ def responses_endpoint(entity):
         })
 
     if filter_test:
-        from sqlalchemy import text, func
+        filter_clause, filter_params = filter_sql(filter_test)
+        sample_from, sample_params = sample_ids_sql(sample)
         
-        # Build the filter conditions
-        filter_conditions = []
-        for field in filter_test:
-            filter_conditions.append(f"(match ->> '{field}')::boolean = true")
-    
-        filter_clause = " AND ".join(filter_conditions)
-        
-        # Calculate total results count for filtered data
-        count_sql = text(f"""
-            SELECT COUNT(*)
+        # Fetch only the IDs that pass the filter, then order and page them in Python with the
+        # cached position map rather than array_position() over the whole sample for every row
+        ids_sql = text(f"""
+            SELECT r.id
             FROM responses r
-            WHERE r.id = ANY(:sample_ids)
+            WHERE r.id IN (SELECT s.id FROM {sample_from})
             AND {filter_clause}
         """)
         
-        count_result = db.session.execute(count_sql, {
-            'sample_ids': sample.ids
-        })
-        total_results_count = count_result.scalar()
-        
-        # Calculate offset
-        offset = (page - 1) * per_page
-        
-        # Order by sample position
-        sql = text(f"""
-            SELECT r.id, r.entity, r.date, r.prod, r.walden, r.match
-            FROM responses r
-            WHERE r.id = ANY(:sample_ids)
-            AND {filter_clause}
-            ORDER BY array_position(:sample_ids, r.id)
-            LIMIT :limit OFFSET :offset
-        """)
+        filtered_ids = [row.id for row in db.session.execute(ids_sql, {
+            **filter_params,
+            **sample_params
+        })]
+        filtered_ids.sort(key=sample.positions.__getitem__)
+        total_results_count = len(filtered_ids)
         
-        # Execute the query
-        result = db.session.execute(sql, {
-            'sample_ids': sample.ids,
-            'limit': per_page,
-            'offset': offset
-        })
-        
-        # Convert results to dict format
-        ordered_responses = []
-        for row in result:
-            ordered_responses.append({
-                'id': row.id,
-                'entity': row.entity,
-                'date': row.date,
-                'prod': row.prod,
-                'walden': row.walden,
-                'match': row.match
-            })
+        start_idx = (page - 1) * per_page
+        end_idx = start_idx + per_page
+        page_ids = filtered_ids[start_idx:end_idx]
         
     else:
         # Normal pagination - get slice of IDs first, then query
         start_idx = (page - 1) * per_page
         end_idx = start_idx + per_page
         page_ids = sample.ids[start_idx:end_idx]
-        
-        # Query responses matching these IDs
-        responses_dict = {}
-        responses = Response.query.filter(Response.id.in_(page_ids)).all()
-        
-        # Create a dictionary for fast lookup
-        for response in responses:
-            responses_dict[response.id] = response
-        
-        # Return responses in the same order as sample IDs
-        ordered_responses = []
-        for id in page_ids:
-            if id in responses_dict:
-                ordered_responses.append(responses_dict[id].to_dict())
     
         total_results_count = len(sample.ids)
     
+    ordered_responses = fetch_responses(page_ids, sample.positions, fields)
+    
     return jsonify({
         "meta": {
             "page": page,
@@ -161,6 +323,204 @@ def responses_endpoint(entity):
     })
 
 
+@app.route("/responses/<entity>/facets", methods=["GET"])
+@read_only
+def facets_endpoint(entity):
+    """
+    Exact hit counts for every test key within the latest sample, narrowed by filterTest.
+    The filtered set is scanned once: the CTE is materialized and feeds both the total count
+    and a jsonb_each() grouping over the match documents.
+    """
+    filter_test = request.args.get("filterTest", "")
+    scope = request.args.get("sample", "all")
+    if filter_test:
+        filter_test = filter_test.split(",")
+
+    test_keys = get_test_keys(entity) if entity in tests_schema else []
+    sample = get_latest_sample(entity, scope=scope)
+    if not sample or not sample.ids:
+        return jsonify({
+            "meta": {
+                "sample_size": 0,
+                "count": 0
+            },
+            "facets": {test_key: 0 for test_key in test_keys}
+        })
+
+    filter_clause, filter_params = filter_sql(filter_test) if filter_test else ("TRUE", {})
+    sample_from, sample_params = sample_ids_sql(sample)
+    sql = text(f"""
+        WITH filtered AS MATERIALIZED (
+            SELECT r.match
+            FROM responses r
+            WHERE r.id IN (SELECT s.id FROM {sample_from})
+            AND {filter_clause}
+        )
+        SELECT NULL AS test_key, COUNT(*) AS hits
+        FROM filtered
+        UNION ALL
+        SELECT m.key AS test_key, COUNT(*) AS hits
+        FROM filtered, jsonb_each(filtered.match) AS m(key, value)
+        WHERE m.value = 'true'::jsonb
+        GROUP BY m.key
+    """)
+    rows = db.session.execute(sql, {**filter_params, **sample_params})
+
+    facets = {test_key: 0 for test_key in test_keys}
+    total_results_count = 0
+    for row in rows:
+        if row.test_key is None:
+            total_results_count = row.hits
+        elif row.test_key in facets:
+            facets[row.test_key] = row.hits
+
+    return jsonify({
+        "meta": {
+            "sample_size": len(sample.ids),
+            "count": total_results_count
+        },
+        "facets": facets
+    })
+
+
+# path: IDs of some entities contain slashes, e.g. "countries/FO" or "work-types/article"
+@app.route("/responses/<entity>/<path:id>/history", methods=["GET"])
+@read_only
+def response_history_endpoint(entity, id):
+    """
+    Match transitions of one record across runs, from the partitioned response_history table.
+    The run_date range lets Postgres prune every partition outside from/to.
+    """
+    try:
+        # run_date is a date, so the default upper bound is the end of today
+        date_to = datetime.strptime(request.args.get("to", datetime.now().strftime("%Y-%m-%d")), "%Y-%m-%d") + timedelta(days=1)
+        date_from = datetime.strptime(request.args["from"], "%Y-%m-%d") if "from" in request.args else date_to - timedelta(days=HISTORY_DEFAULT_DAYS)
+    except ValueError:
+        return jsonify({"error": "from and to must be dates formatted as YYYY-MM-DD"}), 400
+
+    sql = text(f"""
+        SELECT run_date, match
+        FROM {HISTORY_TABLE}
+        WHERE id = :id
+        AND entity = :entity
+        AND run_date >= :date_from
+        AND run_date < :date_to
+        ORDER BY run_date
+    """)
+    try:
+        rows = db.session.execute(sql, {
+            'id': id,
+            'entity': entity,
+            'date_from': date_from.date(),
+            'date_to': date_to.date()
+        }).all()
+    except ProgrammingError:
+        db.session.rollback()
+        return jsonify({"error": "Response history is not enabled"}), 404
+
+    return jsonify({
+        "meta": {
+            "id": id,
+            "entity": entity,
+            "from": date_from,
+            "to": date_to,
+            "runs": len(rows)
+        },
+        "results": match_transitions(rows)
+    })
+
+
+def export_json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def export_csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list, bool)):
+        return json.dumps(value, default=export_json_default)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+@app.route("/responses/<entity>/export", methods=["GET"])
+@read_only
+def export_endpoint(entity):
+    """
+    Stream every response of the latest sample as NDJSON or CSV, in sample order.
+    Rows come from a server-side cursor in batches of EXPORT_BATCH_SIZE, so memory stays flat
+    regardless of sample size. Supports the same filterTest and fields parameters as /responses.
+    """
+    export_format = request.args.get("format", "ndjson")
+    filter_test = request.args.get("filterTest", "")
+    scope = request.args.get("sample", "all")
+    if filter_test:
+        filter_test = filter_test.split(",")
+
+    if export_format not in ("ndjson", "csv"):
+        return jsonify({"error": "format must be one of: ndjson, csv"}), 400
+    try:
+        fields = parse_fields(request.args.get("fields", ""))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    sample = get_latest_sample(entity, scope=scope)
+    if not sample or not sample.ids:
+        return jsonify({"error": f"No sample found for {entity} ({scope})"}), 404
+
+    select_list, joins, params = projection_sql(fields)
+    filter_clause, filter_params = filter_sql(filter_test) if filter_test else ("TRUE", {})
+    sample_from, sample_params = sample_ids_sql(sample)
+    sql = text(f"""
+        SELECT {select_list}
+        FROM {sample_from}
+        JOIN responses r ON r.id = s.id
+        {joins}
+        WHERE {filter_clause}
+        ORDER BY s.position
+    """)
+    params = {**params, **filter_params, **sample_params}
+
+    def generate():
+        result = db.session.execute(sql, params, execution_options={"stream_results": True})
+        if export_format == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(field_names(fields))
+            for rows in result.partitions(EXPORT_BATCH_SIZE):
+                for row in rows:
+                    writer.writerow([export_csv_value(value) for value in row_values(row, fields)])
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+        else:
+            for rows in result.partitions(EXPORT_BATCH_SIZE):
+                yield "".join(json.dumps(row_to_dict(row, fields), default=export_json_default) + "\n" for row in rows)
+
+    mimetype = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    response = app.response_class(stream_with_context(generate()), mimetype=mimetype)
+    response.headers["Content-Disposition"] = attachment_header(f"{entity}-{sample.name}.{export_format}")
+    return response
+
+
+def attachment_header(filename):
+    """
+    Content-Disposition for downloading filename, quoted as needed, as Flask's send_file does:
+    non-ASCII names get an ASCII fallback plus the UTF-8 name in filename* (RFC 5987).
+    """
+    try:
+        filename.encode("ascii")
+        names = {"filename": filename}
+    except UnicodeEncodeError:
+        fallback = unicodedata.normalize("NFKD", filename).encode("ascii", "ignore").decode("ascii")
+        names = {"filename": fallback, "filename*": f"UTF-8''{quote(filename, safe='')}"}
+    return dump_options_header("attachment", names)
+
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5106))
     app.run(host="0.0.0.0", port=port)